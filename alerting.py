@@ -0,0 +1,306 @@
+import bisect
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import chiller_engine
+
+# ==========================================
+# Alerting: สถิติแบบ Rolling ต่อ Site/Channel อัปเดตทีละ Batch ที่เข้ามา (ไม่ย้อนอ่านประวัติ)
+# แล้วประเมินกฎ (Threshold / Heat Balance) เพื่อกำหนด Status ของ Site อัตโนมัติ
+# ==========================================
+
+NORMAL, MAINTENANCE, CRITICAL = 'Normal', 'Maintenance', 'Critical'
+WINDOW_BLOCKS = 16
+BLOCK_SIZE = 60       # 16 x 60 = หน้าต่างประมาณ 15 นาทีที่ 1 Hz
+EWMA_ALPHA = 0.1
+TRANSITION_HISTORY = 10000
+DELTA_WINDOW = 3600   # Delta ของ Metric เทียบกับเมื่อ 1 ชั่วโมงก่อน (วินาที)
+
+
+class RollingStats:
+    # หน้าต่างแบ่งเป็น Block: เก็บ sum / count / min / max ต่อ Block
+    # ข้อมูลใหม่อัปเดตเฉพาะ Block ปัจจุบัน เมื่อเต็มก็ทิ้ง Block เก่าสุดไปทั้งก้อน
+    # ต้นทุนต่อ sample จึงคงที่ และหน้าต่างยาว (blocks - 1) x block_size ถึง blocks x block_size
+    def __init__(self, n_channels, blocks=WINDOW_BLOCKS, block_size=BLOCK_SIZE, alpha=EWMA_ALPHA):
+        self.blocks = blocks
+        self.block_size = block_size
+        self.alpha = alpha
+        self.sums = np.zeros((blocks, n_channels))
+        self.counts = np.zeros((blocks, n_channels))
+        self.mins = np.full((blocks, n_channels), np.inf)
+        self.maxs = np.full((blocks, n_channels), -np.inf)
+        self.first_time = np.full(blocks, np.nan)
+        self.first_value = np.full((blocks, n_channels), np.nan)
+        self.current = 0
+        self.filled = 0  # จำนวน sample ใน Block ปัจจุบัน
+        self.ewma = np.full(n_channels, np.nan)
+        self.last_time = np.nan
+        self.last_value = np.full(n_channels, np.nan)
+
+    def _start_block(self, t, values):
+        self.current = (self.current + 1) % self.blocks
+        self.sums[self.current] = 0.0
+        self.counts[self.current] = 0.0
+        self.mins[self.current] = np.inf
+        self.maxs[self.current] = -np.inf
+        self.first_time[self.current] = t
+        self.first_value[self.current] = values
+        self.filled = 0
+
+    def _update_ewma(self, values):
+        # EWMA ทั้ง Batch แบบปิด: e_n = (1-a)^n e_0 + sum a(1-a)^(n-1-i) x_i
+        # ค่า NaN (เซ็นเซอร์ไม่ส่งค่า) ถือว่าไม่เปลี่ยน EWMA  Channel ที่ยังไม่มี EWMA เริ่มจากค่าแรกที่ไม่ใช่ NaN
+        valid = ~np.isnan(values)
+        first = values[valid.argmax(axis=0), np.arange(values.shape[1])]
+        e0 = np.where(np.isnan(self.ewma), first, self.ewma)
+        e0 = np.where(np.isnan(e0), 0.0, e0)
+        x = np.where(np.isnan(values), e0, values)
+        n = len(x)
+        decay = (1.0 - self.alpha) ** np.arange(n - 1, -1, -1)
+        ewma = (1.0 - self.alpha) ** n * e0 + self.alpha * (decay[:, None] * x).sum(axis=0)
+        seen = ~np.isnan(self.ewma) | valid.any(axis=0)
+        self.ewma = np.where(seen, ewma, np.nan)
+
+    def update(self, times, values):
+        if self.filled == 0 and np.isnan(self.first_time[self.current]):
+            self.first_time[self.current] = times[0]
+            self.first_value[self.current] = values[0]
+
+        start = 0
+        while start < len(times):
+            if self.filled == self.block_size:
+                self._start_block(times[start], values[start])
+            end = min(len(times), start + self.block_size - self.filled)
+            chunk = values[start:end]
+            valid = ~np.isnan(chunk)
+            b = self.current
+            self.sums[b] += np.where(valid, chunk, 0.0).sum(axis=0)
+            self.counts[b] += valid.sum(axis=0)
+            self.mins[b] = np.fmin(self.mins[b], np.where(valid, chunk, np.inf).min(axis=0))
+            self.maxs[b] = np.fmax(self.maxs[b], np.where(valid, chunk, -np.inf).max(axis=0))
+            self.filled += end - start
+            start = end
+
+        self._update_ewma(values)
+        self.last_time = times[-1]
+        latest = values[-1]
+        self.last_value = np.where(np.isnan(latest), self.last_value, latest)
+
+    def mean(self):
+        counts = self.counts.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, self.sums.sum(axis=0) / counts, np.nan), counts
+
+    def snapshot(self):
+        mean, counts = self.mean()
+        lo, hi = self.mins.min(axis=0), self.maxs.max(axis=0)
+        oldest = (self.current + 1) % self.blocks
+        if np.isnan(self.first_time[oldest]):
+            oldest = int(np.nanargmin(self.first_time))
+        dt = self.last_time - self.first_time[oldest]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rate = (self.last_value - self.first_value[oldest]) / dt if dt > 0 else np.full_like(mean, np.nan)
+        return {
+            'mean': mean,
+            'min': np.where(np.isfinite(lo), lo, np.nan),
+            'max': np.where(np.isfinite(hi), hi, np.nan),
+            'ewma': self.ewma,
+            'rate': rate,        # หน่วยต่อวินาที (เทียบต้นหน้าต่าง)
+            'last': self.last_value,
+            'count': counts,
+        }
+
+
+# --- กฎแบบ Threshold: เช่น CQ4 (น้ำเย็นออก) ค่า EWMA เกิน 50°F ---
+class ThresholdRule:
+    OPS = {'>': np.greater, '>=': np.greater_equal, '<': np.less, '<=': np.less_equal}
+
+    def __init__(self, name, channel, op, value, stat='ewma', status=CRITICAL):
+        self.name = name
+        self.channel = channel
+        self.op = op
+        self.value = value
+        self.stat = stat
+        self.status = status
+
+    def evaluate(self, stats, channels):
+        x = stats[self.stat][channels.index(self.channel)]
+        return bool(self.OPS[self.op](x, self.value)) if not np.isnan(x) else False
+
+
+# --- กฎ Heat Balance: ใช้ค่าเฉลี่ยในหน้าต่างกับ Flow (GPM) และ Power ของ Chiller ของ Site ---
+# Stream มีแค่อุณหภูมิ/ความดัน (CQ7 คือโหลดไฟฟ้าทั้งอาคาร ไม่ใช่ Chiller) จึงใช้ Flow และ Power
+# จากการสำรวจหน้างาน (power_kw) หรือจาก Channel ที่วัด Power ของ Chiller โดยตรง (power_channel)
+class HeatBalanceRule:
+    def __init__(self, name, evap_gpm, cond_gpm, power_kw=None, power_channel=None,
+                 limit=chiller_engine.HEAT_BALANCE_LIMIT, status=CRITICAL):
+        if (power_kw is None) == (power_channel is None):
+            raise ValueError("ต้องระบุ power_kw หรือ power_channel อย่างใดอย่างหนึ่ง")
+        self.name = name
+        self.evap_gpm = evap_gpm
+        self.cond_gpm = cond_gpm
+        self.power_kw = power_kw
+        self.power_channel = power_channel
+        self.limit = limit
+        self.status = status
+
+    def compute(self, stats, channels):
+        m = stats['mean']
+        cq = {c: m[channels.index(c)] for c in ('CQ1', 'CQ2', 'CQ3', 'CQ4')}
+        power = self.power_kw if self.power_channel is None else m[channels.index(self.power_channel)]
+        return chiller_engine.compute(cq['CQ1'], cq['CQ2'], cq['CQ3'], cq['CQ4'],
+                                      self.evap_gpm, self.cond_gpm, power, limit=self.limit)
+
+    def evaluate(self, stats, channels):
+        result = self.compute(stats, channels)
+        hb = result['heat_balance']
+        return bool(not np.isnan(hb) and not result['heat_balance_pass'])
+
+
+# --- สร้างกฎ Heat Balance ต่อ Site จากข้อมูล Chiller ใน Site Registry (เฉพาะ Site ที่กรอกครบ) ---
+def heat_balance_rules(frame):
+    rules = {}
+    plants = frame.dropna(subset=['Evap GPM', 'Cond GPM', 'Chiller kW'])
+    for site, evap_gpm, cond_gpm, power_kw in plants[['Site Name', 'Evap GPM', 'Cond GPM', 'Chiller kW']].itertuples(index=False):
+        rules[site] = [HeatBalanceRule("Heat balance out of ±5%", float(evap_gpm), float(cond_gpm), power_kw=float(power_kw))]
+    return rules
+
+
+DEFAULT_RULES = [
+    ThresholdRule("Chilled water supply too warm", 'CQ4', '>', 50.0),
+    ThresholdRule("Condenser water inlet too hot", 'CQ1', '>', 95.0),
+]
+
+
+class AlertEngine:
+    def __init__(self, channels, rules=DEFAULT_RULES, delta_window=DELTA_WINDOW):
+        self.channels = tuple(channels)
+        self.rules = list(rules)
+        self.site_rules = {}     # กฎเฉพาะ Site (เช่น Heat Balance ที่ต้องใช้ Flow ของแต่ละที่)
+        self.delta_window = delta_window
+        self.stats = {}
+        self.manual = {}         # Status ที่ Admin ตั้งใน Site Registry
+        self.alerts = {}         # ชื่อกฎที่กำลัง trigger ต่อ Site
+        self.status = {}
+        self.counts = {NORMAL: 0, MAINTENANCE: 0, CRITICAL: 0}
+        self.transitions = deque(maxlen=TRANSITION_HISTORY)
+        self._count_times = deque(maxlen=TRANSITION_HISTORY)
+        self._count_history = deque(maxlen=TRANSITION_HISTORY)
+        self.registry_version = None
+        self._baseline = 0
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def _effective(self, site):
+        manual = self.manual.get(site, NORMAL)
+        if manual == MAINTENANCE:
+            return MAINTENANCE
+        alerts = self.alerts.get(site)
+        if alerts:
+            return CRITICAL if any(rule.status == CRITICAL for rule in alerts) else MAINTENANCE
+        return manual if site not in self.stats else NORMAL
+
+    def _set_status(self, site, t, reason):
+        old = self.status.get(site)
+        new = self._effective(site)
+        if old == new:
+            return
+        if old is not None:
+            self.counts[old] = self.counts.get(old, 0) - 1
+        self.counts[new] = self.counts.get(new, 0) + 1
+        self.status[site] = new
+        self.transitions.append((t, site, old, new, reason))
+        self._record_count()
+
+    def _record_count(self):
+        # ใช้เวลาของ Server (เรียงตามลำดับเสมอ) สำหรับคำนวณ Delta
+        self._count_times.append(time.time())
+        self._count_history.append(self.counts.get(CRITICAL, 0))
+        self.version += 1
+
+    # --- รับรายชื่อ Site, Status ที่ตั้งด้วยมือ และกฎเฉพาะ Site จากตาราง Site Registry ---
+    # เรียกได้ทุก Rerun: สร้างกฎ Heat Balance ใหม่เฉพาะเมื่อ version ของ Registry เปลี่ยน
+    # นับ Status เฉพาะ Site ที่อยู่ใน Registry: Telemetry ของ Site อื่นเก็บสถิติไว้ แต่ไม่นับใน Metric
+    def sync_sites(self, version, frame):
+        with self._lock:
+            if version == self.registry_version:
+                return
+            now = time.time()
+            manual = dict(zip(frame['Site Name'], frame['Status']))
+            self.site_rules = heat_balance_rules(frame)
+            for site, stats in self.stats.items():
+                self._evaluate(site, stats.snapshot())
+            for site in set(self.manual) - set(manual):
+                old = self.status.pop(site, None)
+                if old is not None:
+                    self.counts[old] -= 1
+                    self._record_count()
+            self.manual = manual
+            for site in manual:
+                self._set_status(site, now, "registry")
+            if self.registry_version is None:
+                # ค่าเริ่มต้นตอนเปิด Server ไม่นับเป็นการเปลี่ยนแปลงของ Delta
+                self._count_times.clear()
+                self._count_history.clear()
+                self._baseline = self.count(CRITICAL)
+            self.registry_version = version
+
+    def _evaluate(self, site, snap):
+        triggered = [rule for rule in self.rules + self.site_rules.get(site, [])
+                     if rule.evaluate(snap, self.channels)]
+        self.alerts[site] = triggered
+        return triggered
+
+    # --- Callback จาก TelemetryHub: อัปเดตสถิติแล้วประเมินกฎ ---
+    def on_batch(self, site, times, values):
+        with self._lock:
+            stats = self.stats.get(site)
+            if stats is None:
+                stats = self.stats[site] = RollingStats(len(self.channels))
+            stats.update(np.asarray(times, dtype=np.float64), np.asarray(values, dtype=np.float64))
+
+            triggered = self._evaluate(site, stats.snapshot())
+            if site in self.manual:
+                self._set_status(site, float(times[-1]), ", ".join(rule.name for rule in triggered) or "recovered")
+
+    # --- ฝั่งหน้าเว็บ: อ่านผ่าน lock เพราะ Thread รับข้อมูลแก้ไขค่าเหล่านี้อยู่ตลอด ---
+    def site_stats(self, site):
+        with self._lock:
+            stats = self.stats.get(site)
+            return stats.snapshot() if stats is not None else None
+
+    # --- ค่าเฉลี่ยในหน้าต่างของหลาย Site เป็น array (n_sites, n_channels) Site ที่ไม่มีข้อมูลเป็น NaN ---
+    # ถือ lock เฉพาะตอน copy ผลรวม / จำนวน (ไม่คำนวณ snapshot เต็ม) Thread รับข้อมูลจึงไม่ต้องรอนาน
+    def site_means(self, sites):
+        n = len(self.channels)
+        sums, counts = np.zeros((len(sites), n)), np.zeros((len(sites), n))
+        with self._lock:
+            for i, site in enumerate(sites):
+                stats = self.stats.get(site)
+                if stats is not None:
+                    sums[i] = stats.sums.sum(axis=0)
+                    counts[i] = stats.counts.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, sums / counts, np.nan)
+
+    def status_snapshot(self):
+        with self._lock:
+            return dict(self.status)
+
+    def recent_transitions(self, n=20):
+        with self._lock:
+            return list(self.transitions)[-n:]
+
+    def count(self, status):
+        return self.counts.get(status, 0)
+
+    # --- Delta ของจำนวน Critical เทียบกับ delta_window วินาทีก่อน (ค้นแบบ bisect) ---
+    def critical_delta(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            i = bisect.bisect_right(self._count_times, now - self.delta_window)
+            before = self._count_history[i - 1] if i > 0 else self._baseline
+            return self.count(CRITICAL) - before
@@ -1,8 +1,22 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
+import os
+import threading
 import time
+import uuid
 import extra_streamlit_components as stx
+from user_directory import UserDirectory
+import telemetry
+from site_registry import SiteRegistry, PLANT_COLUMNS
+from site_map import SiteMapLayer
+import calibration
+import alerting
+import chiller_engine
+from history_store import HistoryStore
+import downsampling
+import fetchers
+from profiling import Profiler
 
 # --- 1. ตั้งค่าหน้าเว็บ (บรรทัดแรกสุด) ---
 st.set_page_config(
@@ -17,26 +31,129 @@ st.set_page_config(
 # ==========================================
 SHEET_URL = "https://docs.google.com/spreadsheets/d/e/2PACX-1vR0XoahMwduVM49_EJjYxMnbU9ABtSZzYPiInXBvSf_LhtAJqhl_5FRw-YrHQ7EIl2wbN27uZv0YTz9/pub?output=csv"
 FORM_URL = "https://docs.google.com/forms/d/e/1FAIpQLSdx0bamRVPVOfiBXMpbbOSZny9Snr4U0VImflmJwm6KcdYKSA/viewform?usp=publish-editor"
+# ใส่ path ไฟล์ CSV แทน URL ได้ (ทดสอบแบบ Offline) และปรับอายุ Cache ของรายชื่อสมาชิก (วินาที)
+USERS_SOURCE = os.environ.get("SENSOR_USERS_SOURCE", SHEET_URL)
+USERS_TTL = float(os.environ.get("SENSOR_USERS_TTL", "300"))
+# แหล่งข้อมูลเซ็นเซอร์ Real-time เช่น "udp://0.0.0.0:9870" หรือ path ไฟล์ที่ Gateway เขียนต่อท้าย
+TELEMETRY_SOURCE = os.environ.get("SENSOR_TELEMETRY_SOURCE", "")
+# ไฟล์ JSON รายการ Gateway / Sheet ที่ต้องดึงตามรอบ เช่น [{"name": "RBS Rayong", "url": "http://...", "interval": 30, "kind": "telemetry"}]
+FEEDS_CONFIG = os.environ.get("SENSOR_FEEDS", "")
+# โฟลเดอร์เก็บข้อมูลในเครื่อง (รายชื่อ Site, ผลสอบเทียบ, ข้อมูลย้อนหลัง ฯลฯ)
+DATA_DIR = os.environ.get("SENSOR_DATA_DIR", "data")
+# กราฟ Trend: ความกว้างโดยประมาณ (px) ใช้กำหนดจำนวนจุดสูงสุด และจำนวนวันที่เติม Rollup จาก History ตอนเปิด Server
+TREND_WIDTH_PX = 1000
+ROLLUP_BACKFILL_DAYS = 7
+PLANT_METRICS_TTL = 60
+TREND_RANGES = {"10 นาที": 600, "1 ชั่วโมง": 3600, "6 ชั่วโมง": 6 * 3600, "24 ชั่วโมง": 86400, "7 วัน": 7 * 86400, "30 วัน": 30 * 86400}
 # ==========================================
 
 # --- Setup Cookie Manager (แก้ไขใหม่: ลบ Cache ออกเพื่อแก้ Error) ---
 cookie_manager = stx.CookieManager()
 
+# --- Profiler (จับเวลา Rerun / I/O รวมทุก Session) ---
+@st.cache_resource
+def get_profiler():
+    return Profiler()
+
+profiler = get_profiler()
+
+# --- User Directory (โหลด Sheet ครั้งเดียว ใช้ร่วมกันทุก Session) ---
+@st.cache_resource
+def get_user_directory():
+    return UserDirectory(USERS_SOURCE, ttl=USERS_TTL)
+
+# --- Alert Engine (สถิติ Rolling + กฎแจ้งเตือน กำหนด Status ของ Site) ---
+@st.cache_resource
+def get_alert_engine():
+    return alerting.AlertEngine(telemetry.CHANNELS)
+
+# --- History Store (ไฟล์ Parquet แบ่งตาม Site / วัน) ---
+@st.cache_resource
+def get_history_store():
+    return HistoryStore(os.path.join(DATA_DIR, "history"), telemetry.CHANNELS).start()
+
+# --- Rollup 1 นาที / 15 นาที / 1 ชั่วโมง สำหรับกราฟช่วงยาว (เติมจาก History ใน background) ---
+@st.cache_resource
+def get_rollups():
+    rollups = downsampling.RollupPyramid(telemetry.CHANNELS)
+    store = get_history_store()
+    end = time.time()
+    start = end - ROLLUP_BACKFILL_DAYS * 86400
+
+    def backfill():
+        for site in store.sites():
+            rollups.backfill(store, site, start, end)
+
+    threading.Thread(target=backfill, name="rollup-backfill", daemon=True).start()
+    return rollups
+
+# --- Telemetry Hub (Ring Buffer ชุดเดียวต่อ Server Process) ---
+@st.cache_resource
+def get_telemetry_hub():
+    hub = telemetry.TelemetryHub()
+    hub.subscribe(get_alert_engine().on_batch)
+    hub.subscribe(get_history_store().append)
+    hub.subscribe(get_rollups().update)
+    if TELEMETRY_SOURCE:
+        telemetry.Ingestor(hub, telemetry.make_source(TELEMETRY_SOURCE)).start()
+    return hub
+
+# --- Fetcher Pool (ดึงข้อมูล Remote หลายแหล่งพร้อมกัน นอก Script Thread) ---
+@st.cache_resource
+def get_fetcher_pool():
+    hub = get_telemetry_hub()
+    # Feed ตอบข้อมูลทั้งชุดทุกรอบ Poll: รับเฉพาะแถวที่ใหม่กว่าที่รับไปแล้วของแต่ละ Site
+    handlers = {'telemetry': lambda text: hub.ingest_lines(text.splitlines(), skip_seen=True)}
+    sources = fetchers.load_sources(FEEDS_CONFIG, handlers) if FEEDS_CONFIG else []
+    return fetchers.FetcherPool(sources).start()
+
+# --- Site Registry (ข้อมูล Site ชุดเดียว ใช้ร่วมกันทุก Session) ---
+@st.cache_resource
+def get_site_registry():
+    return SiteRegistry(os.path.join(DATA_DIR, "sites.parquet"))
+
+# --- ผลสอบเทียบเซ็นเซอร์ (คำนวณครั้งเดียว เก็บไว้ให้ทุก Session อ่าน) ---
+@st.cache_resource
+def get_calibration_cache():
+    return calibration.CalibrationCache(DATA_DIR)
+
+# --- ข้อมูล Site พร้อม Status จาก Alert Engine (สร้างใหม่เมื่อ version ใด version หนึ่งเปลี่ยน) ---
+@st.cache_resource(max_entries=2)
+def get_live_sites(version, status_version, _sites):
+    status = get_alert_engine().status_snapshot()
+    return _sites.assign(Status=_sites['Site Name'].map(status).fillna(_sites['Status']))
+
+# --- Map Layer: สร้างใหม่เฉพาะเมื่อข้อมูล Site หรือ Status เปลี่ยน ---
+@st.cache_resource(max_entries=2)
+def get_site_map_layer(version, status_version, _sites):
+    return SiteMapLayer(_sites)
+
+# --- เช็คทุก 5 วินาทีว่ามีคนแก้ข้อมูล Site หรือ Status เปลี่ยน ถ้ามีค่อย Rerun ทั้งหน้า ---
+@st.fragment(run_every=5)
+def watch_site_registry(version, status_version):
+    if get_site_registry().version != version or get_alert_engine().version != status_version:
+        st.rerun()
+
+# --- Heat Balance / kW/RT ของทุก Site ที่มีข้อมูล Chiller (คำนวณทีเดียวทั้ง Fleet จากค่าเฉลี่ยในหน้าต่าง) ---
+# คำนวณใหม่เมื่อข้อมูล Site / Status เปลี่ยน หรือทุก PLANT_METRICS_TTL วินาที (ค่าเฉลี่ยขยับตามข้อมูลที่เข้ามา)
+@st.cache_resource(max_entries=2)
+def get_plant_metrics(version, status_version, time_bucket, _frame):
+    plants = _frame.dropna(subset=PLANT_COLUMNS)
+    means = get_alert_engine().site_means(plants['Site Name'].tolist())
+    cq = {c: means[:, telemetry.CHANNELS.index(c)] for c in ('CQ1', 'CQ2', 'CQ3', 'CQ4')}
+    result = chiller_engine.compute(cq['CQ1'], cq['CQ2'], cq['CQ3'], cq['CQ4'],
+                                    plants['Evap GPM'].to_numpy(), plants['Cond GPM'].to_numpy(), plants['Chiller kW'].to_numpy())
+    live = ~np.isnan(result['heat_balance'])
+    return {
+        'live': int(live.sum()),
+        'passed': int(result['heat_balance_pass'][live].sum()),
+        'kw_per_rt': float(np.nanmean(result['kw_per_rt'][live])) if live.any() else np.nan,
+    }
+
 # --- ฟังก์ชันโหลดข้อมูล User ---
 def load_users():
-    try:
-        df = pd.read_csv(SHEET_URL, on_bad_lines='skip')
-        if len(df.columns) >= 5:
-            df.columns.values[1] = 'username'
-            df.columns.values[2] = 'password'
-            df.columns.values[3] = 'name'
-            df.columns.values[4] = 'role'
-        
-        df['password'] = df['password'].astype(str)
-        df['role'] = df['role'].fillna('User')
-        return df
-    except Exception as e:
-        return pd.DataFrame()
+    with profiler.span("io:load_users"):
+        return get_user_directory().users()
 
 # --- ฟังก์ชันตรวจสอบ Cookie เพื่อ Auto-Login ---
 def check_cookies():
@@ -46,14 +163,13 @@ def check_cookies():
         cookie_user = cookie_manager.get(cookie="sensor_user")
         
         if cookie_user and not st.session_state.get('logged_in', False):
-            df = load_users()
-            user_match = df[df['username'].astype(str) == str(cookie_user)]
+            with profiler.span("io:user_lookup"):
+                user_data = get_user_directory().get(cookie_user)
             
-            if not user_match.empty:
-                user_data = user_match.iloc[0]
+            if user_data is not None:
                 st.session_state['logged_in'] = True
                 st.session_state['user'] = user_data['name']
-                st.session_state['role'] = str(user_data['role']).strip()
+                st.session_state['role'] = user_data['role']
     except:
         pass # ถ้าอ่าน Cookie ไม่ได้ ให้ข้ามไป (รอ Login ปกติ)
 
@@ -76,20 +192,15 @@ def login_page():
         password = st.text_input("Password", type="password", key="login_pass")
         
         if st.button("Login", use_container_width=True):
-            df = load_users()
-            if not df.empty:
-                user_match = df[
-                    (df['username'].astype(str) == username) & 
-                    (df['password'].astype(str) == password)
-                ]
-                
-                if not user_match.empty:
-                    user_data = user_match.iloc[0]
-                    
+            directory = get_user_directory()
+            with profiler.span("io:user_lookup"):
+                user_data = directory.authenticate(username, password)
+            if directory.index:
+                if user_data is not None:
                     # 1. บันทึก Session
                     st.session_state['logged_in'] = True
                     st.session_state['user'] = user_data['name']
-                    st.session_state['role'] = str(user_data['role']).strip()
+                    st.session_state['role'] = user_data['role']
                     
                     # 2. ฝัง Cookie (จำชื่อ Username ไว้ 7 วัน)
                     cookie_manager.set("sensor_user", username, expires_at=pd.Timestamp.now() + pd.Timedelta(days=7))
@@ -120,6 +231,21 @@ def main_app():
             if st.checkbox("ดูรายชื่อสมาชิก"):
                 st.dataframe(load_users())
                 st.caption("ไปแก้สิทธิ์ที่ Google Sheet นะครับ")
+            if st.checkbox("สถานะ Feed"):
+                feeds = pd.DataFrame(get_fetcher_pool().status(), columns=['Source', 'Circuit', 'Last Fetch', 'Status', 'Elapsed (s)', 'Error'])
+                feeds['Last Fetch'] = pd.to_datetime(feeds['Last Fetch'], unit='s')
+                st.dataframe(feeds, hide_index=True)
+            if st.checkbox("⏱️ Rerun Profiling"):
+                rerun_stats = profiler.spans.get("rerun")
+                if rerun_stats is not None:
+                    p50, p95, p99 = rerun_stats.percentiles()
+                    c1, c2, c3 = st.columns(3)
+                    c1.metric("p50", f"{p50 * 1000:.0f} ms")
+                    c2.metric("p95", f"{p95 * 1000:.0f} ms")
+                    c3.metric("p99", f"{p99 * 1000:.0f} ms")
+                st.dataframe(pd.DataFrame(profiler.report()).round(1), hide_index=True)
+                st.caption("แยกต่อ Session (เรียงตาม p95)")
+                st.dataframe(pd.DataFrame(profiler.session_report()).round(1), hide_index=True)
         else:
             st.info(f"Role: {role}")
 
@@ -128,6 +254,7 @@ def main_app():
             cookie_manager.delete("sensor_user")
             st.session_state['logged_in'] = False
             st.rerun()
+    profiler.lap("sidebar")
 
     # --- SETUP QUIZ DATA ---
     quiz_data = {
@@ -169,35 +296,59 @@ def main_app():
         ]
     }
 
+    profiler.lap("quiz_data")
+
+    # เริ่มดึงข้อมูล Feed (ครั้งแรกของ Server เท่านั้น ครั้งต่อไปคืนค่าจาก Cache)
+    get_fetcher_pool()
+
     # Navigation
     st.sidebar.title("🚀 Navigation")
     page = st.sidebar.radio("Go to", ["Dashboard ภาพรวม", "Learning Academy (บทเรียน)", "Quiz ทดสอบความรู้"])
+    profiler.lap("navigation")
 
     # === PAGE 1: DASHBOARD ===
     if page == "Dashboard ภาพรวม":
         st.title("🌏 Real-time Command Center")
         
-        # Mockup Data (ใช้ pd.DataFrame จำลองข้อมูล Site)
-        if 'sites' not in st.session_state:
-            st.session_state.sites = pd.DataFrame({
-                'Site Name': ['RBS Chonburi', 'Central Ayutthaya', 'RBS Rayong', 'Robinson Saraburi'],
-                'Lat': [13.3611, 14.3532, 12.6828, 14.5290],
-                'Lon': [100.9847, 100.5700, 101.2816, 100.9130],
-                'Status': ['Normal', 'Critical', 'Maintenance', 'Normal'],
-            })
+        registry = get_site_registry()
+        snapshot = registry.snapshot()
+        engine = get_alert_engine()
+        engine.sync_sites(snapshot.version, snapshot.frame)
+        status_version = engine.version
+        sites = get_live_sites(snapshot.version, status_version, snapshot.frame)
+        watch_site_registry(snapshot.version, status_version)
 
         col1, col2, col3, col4 = st.columns(4)
-        col1.metric("Total Sites", len(st.session_state.sites))
-        col2.metric("Critical Status", len(st.session_state.sites[st.session_state.sites['Status']=='Critical']), delta="-1")
-        col3.metric("Sensors Online", "98.2%", "stable")
-        col4.metric("Pending PM", "2 Jobs", "Urgent")
+        col1.metric("Total Sites", len(sites))
+        col2.metric("Critical Status", engine.count(alerting.CRITICAL), delta=engine.critical_delta(), delta_color="inverse")
+        plant = get_plant_metrics(snapshot.version, status_version, int(time.time() // PLANT_METRICS_TTL), snapshot.frame)
+        if plant['live']:
+            col3.metric("Heat Balance ผ่าน ±5%", f"{plant['passed']}/{plant['live']} Site",
+                        delta=plant['passed'] - plant['live'] or None, delta_color="normal")
+            col4.metric("Plant kW/RT (เฉลี่ย)", f"{plant['kw_per_rt']:.2f}")
+        else:
+            col3.metric("Heat Balance ผ่าน ±5%", "—")
+            col4.metric("Plant kW/RT (เฉลี่ย)", "—")
+        if plant['live'] == 0 and st.session_state['role'] == 'Admin':
+            st.caption("กรอก Evap GPM / Cond GPM / Chiller kW ของแต่ละ Site ในตาราง Site Data เพื่อคำนวณ Heat Balance และ kW/RT จากข้อมูล Real-time")
+        profiler.lap("dashboard:metrics")
 
         col_map, col_data = st.columns([1, 1])
         with col_map:
             st.subheader("📍 Site Map")
-            map_df = st.session_state.sites.copy()
-            map_df['color'] = map_df['Status'].apply(lambda x: '#00FF00' if x=='Normal' else '#FF0000')
-            st.map(map_df, latitude='Lat', longitude='Lon', size=20, color='color')
+            layer = get_site_map_layer(snapshot.version, status_version, sites)
+            focus = st.selectbox("ซูมไปที่", ["ทั้งหมด"] + sites['Site Name'].tolist(), key="map_focus", label_visibility="collapsed")
+            if focus == "ทั้งหมด":
+                map_df, cell_size = layer.view()
+                zoom = None
+            else:
+                site = sites[sites['Site Name'] == focus].iloc[0]
+                map_df, cell_size = layer.view_bounds(site['Lat'] - 0.5, site['Lat'] + 0.5, site['Lon'] - 0.5, site['Lon'] + 0.5)
+                zoom = 9
+            st.map(map_df, latitude='lat', longitude='lon', size='size', color='color', zoom=zoom)
+            if cell_size:
+                st.caption(f"รวมกลุ่ม {len(sites):,} Site เป็น {len(map_df):,} จุด (Grid {cell_size}°)")
+        profiler.lap("dashboard:map")
 
         with col_data:
             st.subheader("📝 Site Data")
@@ -205,13 +356,85 @@ def main_app():
             # --- 🔒 Check Permission ---
             if st.session_state['role'] == 'Admin':
                 st.caption("🔓 Admin Mode: Editing Enabled")
-                edited_df = st.data_editor(st.session_state.sites, num_rows="dynamic", key="site_edit")
+                edited_df = st.data_editor(snapshot.frame, num_rows="dynamic", key=f"site_edit_{snapshot.version}")
+                if registry.load_error is not None:
+                    st.error(f"อ่านไฟล์ข้อมูล Site ไม่ได้ (ใช้ค่าเริ่มต้นแทน): {registry.load_error}")
                 if st.button("Save Changes"):
-                    st.session_state.sites = edited_df
-                    st.success("Saved!")
+                    try:
+                        with profiler.span("io:registry_save"):
+                            saved = registry.update(edited_df, user=st.session_state['user'], base_version=snapshot.version)
+                    except Exception as e:
+                        saved = None
+                        st.error(f"บันทึกข้อมูลไม่สำเร็จ: {e}")
+                    if saved:
+                        st.success("Saved!")
+                        time.sleep(1)
+                        st.rerun()
+                    elif saved is False:
+                        st.warning("มี Admin คนอื่นบันทึกข้อมูลไปก่อนแล้ว กรุณากด Rerun เพื่อโหลดข้อมูลล่าสุดแล้วแก้ไขใหม่")
             else:
                 st.caption("🔒 Read-only Mode")
-                st.dataframe(st.session_state.sites)
+                st.dataframe(sites)
+        profiler.lap("dashboard:site_data")
+
+        # --- Fleet Calibration (อ่านจากผลที่คำนวณเก็บไว้แล้ว) ---
+        cal_cache = get_calibration_cache()
+        fleet = cal_cache.fleet_status()
+        if not fleet.empty or st.session_state['role'] == 'Admin':
+            st.subheader("🛠️ Fleet Calibration")
+            if not fleet.empty:
+                verdicts = fleet['verdict'].value_counts()
+                c1, c2, c3 = st.columns(3)
+                c1.metric("Pass", int(verdicts.get(calibration.PASS, 0)))
+                c2.metric("Out of Tolerance", int(verdicts.get(calibration.FAIL, 0)))
+                c3.metric("Indeterminate", int(verdicts.get(calibration.INDETERMINATE, 0)))
+                failed = fleet[fleet['verdict'] != calibration.PASS]
+                if not failed.empty:
+                    st.caption("เซ็นเซอร์ที่ต้อง Adjustment หรือเปลี่ยนใหม่")
+                    st.dataframe(failed, hide_index=True)
+
+            if st.session_state['role'] == 'Admin':
+                uploaded = st.file_uploader("อัปโหลดผลสอบเทียบ (CSV)", type="csv", key="cal_upload")
+                if uploaded is not None and st.button("คำนวณผลสอบเทียบ"):
+                    try:
+                        with profiler.span("io:calibration_run"):
+                            points, fits = calibration.run(calibration.read_csv(uploaded))
+                            cal_cache.add(points, fits)
+                        st.success(f"บันทึกผล {fits['sensor_id'].nunique():,} Sensor แล้ว")
+                    except Exception as e:
+                        st.error(f"ไม่สามารถคำนวณผลสอบเทียบได้: {e}")
+        profiler.lap("dashboard:calibration")
+
+        # --- Live Telemetry / Trend (จำนวนจุดไม่เกินความกว้างกราฟ ไม่ว่าจะเลือกช่วงเวลาเท่าไร) ---
+        hub = get_telemetry_hub()
+        rollups = get_rollups()
+        live_sites = sorted(set(hub.sites()) | set(rollups.sites))
+        if live_sites:
+            st.subheader("📈 Live Telemetry")
+            c1, c2, c3 = st.columns([1, 1, 2])
+            live_site = c1.selectbox("Site", live_sites, key="live_site")
+            trend_range = c2.selectbox("ช่วงเวลา", list(TREND_RANGES), key="trend_range")
+            live_channels = c3.multiselect("Channel", list(hub.channels), default=list(hub.channels[:4]), key="live_channels")
+            if live_channels:
+                end = time.time()
+                with profiler.span("io:trend_query"):
+                    trend, step = downsampling.fetch_trend(live_site, end - TREND_RANGES[trend_range], end, live_channels,
+                                                           TREND_WIDTH_PX, rollups, hub=hub, store=get_history_store())
+                if len(trend['time']):
+                    chart_df = pd.DataFrame({c: v for c, v in trend.items() if c != 'time'}, index=pd.to_datetime(trend['time'], unit='s'))
+                    st.line_chart(chart_df)
+                    st.caption(f"ค่าเฉลี่ย / ต่ำสุด / สูงสุด ราย {step // 60} นาที" if step else "ข้อมูลดิบ (ลดจุดแบบ Min/Max)")
+            live_stats = engine.site_stats(live_site)
+            if live_stats is not None:
+                stats_df = pd.DataFrame({k: live_stats[k] for k in ['last', 'mean', 'min', 'max', 'ewma', 'rate']}, index=hub.channels)
+                st.dataframe(stats_df.T)
+            transitions = engine.recent_transitions(20)
+            if transitions:
+                with st.expander("🚨 Status Transitions"):
+                    recent = pd.DataFrame(transitions[::-1], columns=['Time', 'Site', 'From', 'To', 'Reason'])
+                    recent['Time'] = pd.to_datetime(recent['Time'], unit='s')
+                    st.dataframe(recent, hide_index=True)
+        profiler.lap("dashboard:telemetry")
 
     # === PAGE 2: LEARNING ACADEMY ===
     elif page == "Learning Academy (บทเรียน)":
@@ -274,6 +497,7 @@ def main_app():
             with c2:
                 st.subheader("2. จดบันทึกหน้าจอ (HMI)")
                 st.markdown("* Power (kW, V, A)\n* Setpoint\n* Evap/Cond Temp\n* Refrigerant Temp")
+        profiler.lap("academy")
 
     # === PAGE 3: QUIZ ===
     elif page == "Quiz ทดสอบความรู้":
@@ -309,15 +533,22 @@ def main_app():
                 if score >= 8:
                     st.balloons()
                     st.success("สุดยอด! คุณผ่านเกณฑ์ผู้เชี่ยวชาญ 🎉")
+        profiler.lap("quiz")
 
 # --- Main Execution Flow ---
 if 'logged_in' not in st.session_state:
     st.session_state['logged_in'] = False
 
-# เช็ค Cookie ทันทีที่รัน
-check_cookies()
+if 'session_id' not in st.session_state:
+    st.session_state['session_id'] = uuid.uuid4().hex
+
+with profiler.rerun(st.session_state['session_id']):
+    # เช็ค Cookie ทันทีที่รัน
+    check_cookies()
+    profiler.lap("check_cookies")
 
-if not st.session_state['logged_in']:
-    login_page()
-else:
-    main_app()
\ No newline at end of file
+    if not st.session_state['logged_in']:
+        login_page()
+        profiler.lap("login_page")
+    else:
+        main_app()
\ No newline at end of file
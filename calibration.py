@@ -0,0 +1,199 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# Calibration: สอบเทียบเซ็นเซอร์ Zigbee ทั้ง Fleet ทีเดียว (Comparison กับ Testo 440dp)
+# Error = Reading (DUT) - Standard (Ref)
+# ข้อมูลแบบ long format: 1 แถว = 1 ค่าที่อ่านได้ (อ่านซ้ำหลายครั้งต่อจุดได้)
+#   sensor_id, cal_date, quantity, point, dut, ref [, ref_uncertainty, resolution]
+# ==========================================
+
+KEY_COLUMNS = ['sensor_id', 'cal_date']
+POINT_COLUMNS = ['sensor_id', 'cal_date', 'quantity', 'point']
+REQUIRED_COLUMNS = POINT_COLUMNS + ['dut', 'ref']
+
+# เกณฑ์ยอมรับ (±) ต่อชนิดการวัด
+TOLERANCES = {'humidity': 3.0, 'temperature': 0.5}
+# Uncertainty ของ Standard (k=1) และ Resolution ของ DUT ถ้าไม่ได้ระบุมาในไฟล์
+DEFAULT_REF_UNCERTAINTY = {'humidity': 0.8, 'temperature': 0.1}
+DEFAULT_RESOLUTION = {'humidity': 0.1, 'temperature': 0.01}
+COVERAGE_FACTOR = 2.0  # k=2 (~95%)
+
+PASS, FAIL, INDETERMINATE = 'Pass', 'Fail', 'Indeterminate'
+
+
+def read_csv(path_or_buffer):
+    df = pd.read_csv(path_or_buffer)
+    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"ไฟล์สอบเทียบขาดคอลัมน์: {', '.join(missing)}")
+    return df
+
+
+def _per_quantity(quantity, table, column, df):
+    default = quantity.map(table).to_numpy(dtype=np.float64)
+    if column in df.columns:
+        given = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)
+        return np.where(np.isnan(given), default, given)
+    return default
+
+
+# --- ผลรายจุด: Error, Combined / Expanded Uncertainty และผลตัดสิน ---
+def evaluate_points(readings, tolerances=TOLERANCES):
+    df = pd.DataFrame(readings).copy()
+    df['sensor_id'] = df['sensor_id'].astype(str)
+    df['cal_date'] = pd.to_datetime(df['cal_date']).dt.normalize()
+    df['quantity'] = df['quantity'].astype(str).str.strip().str.lower()
+    df['error'] = df['dut'].astype(np.float64) - df['ref'].astype(np.float64)
+    df['ref_uncertainty'] = _per_quantity(df['quantity'], DEFAULT_REF_UNCERTAINTY, 'ref_uncertainty', df)
+    df['resolution'] = _per_quantity(df['quantity'], DEFAULT_RESOLUTION, 'resolution', df)
+
+    points = df.groupby(POINT_COLUMNS, sort=True).agg(
+        dut=('dut', 'mean'),
+        ref=('ref', 'mean'),
+        error=('error', 'mean'),
+        error_std=('error', 'std'),
+        n=('error', 'size'),
+        ref_uncertainty=('ref_uncertainty', 'max'),
+        resolution=('resolution', 'max'),
+    ).reset_index()
+
+    # Type A: ความซ้ำของการอ่าน (std / sqrt(n)), Type B: Standard + Resolution (กระจายแบบสี่เหลี่ยม)
+    n = points['n'].to_numpy(dtype=np.float64)
+    u_repeat = np.nan_to_num(points['error_std'].to_numpy() / np.sqrt(n))
+    u_resolution = points['resolution'].to_numpy() / (2.0 * np.sqrt(3.0))
+    u_combined = np.sqrt(points['ref_uncertainty'].to_numpy() ** 2 + u_resolution ** 2 + u_repeat ** 2)
+    points['u_combined'] = u_combined
+    points['expanded_uncertainty'] = COVERAGE_FACTOR * u_combined
+
+    # Guard band ฝั่งผ่าน: Fail เมื่อ |Error| เกินเกณฑ์, Pass เมื่อ |Error| + U ยังอยู่ในเกณฑ์
+    # Indeterminate เฉพาะช่วง tol - U < |Error| <= tol (ผ่านเกณฑ์ แต่ Uncertainty คร่อมขอบ)
+    tol = points['quantity'].map(tolerances).to_numpy(dtype=np.float64)
+    abs_error = np.abs(points['error'].to_numpy())
+    U = points['expanded_uncertainty'].to_numpy()
+    points['tolerance'] = tol
+    points['verdict'] = np.select(
+        [abs_error > tol, abs_error + U <= tol],
+        [FAIL, PASS],
+        default=INDETERMINATE,
+    )
+    return points.drop(columns=['error_std'])
+
+
+# --- สมการแก้ค่า Ref = slope x DUT + offset ต่อ (sensor, วันที่, ชนิด) ด้วย Least Squares แบบรวมผล ---
+def fit_corrections(points):
+    x = points['dut'].to_numpy(dtype=np.float64)
+    y = points['ref'].to_numpy(dtype=np.float64)
+    groups = ['sensor_id', 'cal_date', 'quantity']
+    sums = pd.DataFrame({
+        'sx': x, 'sy': y, 'sxx': x * x, 'sxy': x * y, 'n': 1,
+    }).groupby([points[g] for g in groups]).sum()
+
+    n, sx, sy = sums['n'].to_numpy(np.float64), sums['sx'].to_numpy(), sums['sy'].to_numpy()
+    den = n * sums['sxx'].to_numpy() - sx * sx
+    # จุดเดียว (หรือทุกจุดค่าเท่ากัน) ใช้แค่ offset
+    ok = (n >= 2) & (np.abs(den) > 1e-12)
+    slope = np.ones_like(n)
+    np.divide(n * sums['sxy'].to_numpy() - sx * sy, den, out=slope, where=ok)
+    offset = (sy - slope * sx) / n
+
+    fits = sums.index.to_frame(index=False)
+    fits['slope'] = slope
+    fits['offset'] = offset
+    fits['points'] = n.astype(np.int64)
+    return fits
+
+
+def run(readings, tolerances=TOLERANCES):
+    points = evaluate_points(readings, tolerances)
+    return points, fit_corrections(points)
+
+
+# --- สรุปต่อ sensor / วันที่: Fail ถ้ามีจุดใด Fail, Pass เมื่อผ่านทุกจุด ---
+def summarize(points):
+    worst = points.assign(
+        fail=points['verdict'] == FAIL,
+        passed=points['verdict'] == PASS,
+        abs_error=points['error'].abs(),
+    ).groupby(KEY_COLUMNS).agg(
+        points=('verdict', 'size'),
+        failed=('fail', 'sum'),
+        all_pass=('passed', 'all'),
+        max_abs_error=('abs_error', 'max'),
+    ).reset_index()
+    worst['verdict'] = np.select(
+        [worst['failed'] > 0, worst['all_pass']],
+        [FAIL, PASS],
+        default=INDETERMINATE,
+    )
+    return worst.drop(columns=['all_pass'])
+
+
+class CalibrationCache:
+    # เก็บผลไว้ตาม (sensor_id, cal_date) ผลใหม่ของคีย์เดิมจะแทนที่ของเก่า
+    # บันทึกเป็นไฟล์ Parquet เพื่อให้ Dashboard เปิดมาแล้วเห็นสถานะทันทีโดยไม่คำนวณใหม่
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.points = self._load('calibration_points.parquet')
+        self.fits = self._load('calibration_fits.parquet')
+        self.version = 0
+        self._status = (None, None)  # (version, DataFrame)
+
+    def _load(self, name):
+        try:
+            return pd.read_parquet(os.path.join(self.directory, name))
+        except Exception:
+            return pd.DataFrame()
+
+    def _save(self, df, name):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _replace(old, new):
+        if old.empty:
+            return new.reset_index(drop=True)
+        keys = pd.MultiIndex.from_frame(new[KEY_COLUMNS].drop_duplicates())
+        keep = ~pd.MultiIndex.from_frame(old[KEY_COLUMNS]).isin(keys)
+        return pd.concat([old[keep], new], ignore_index=True)
+
+    def add(self, points, fits):
+        with self._lock:
+            self.points = self._replace(self.points, points)
+            self.fits = self._replace(self.fits, fits)
+            self._save(self.points, 'calibration_points.parquet')
+            self._save(self.fits, 'calibration_fits.parquet')
+            self.version += 1
+
+    def get(self, sensor_id, cal_date):
+        if self.points.empty:
+            return self.points
+        cal_date = pd.Timestamp(cal_date).normalize()
+        mask = (self.points['sensor_id'] == str(sensor_id)) & (self.points['cal_date'] == cal_date)
+        return self.points[mask]
+
+    # --- สถานะล่าสุดของแต่ละ sensor (คำนวณครั้งเดียวต่อ version) ---
+    # อ่าน version คู่กับ points ภายใต้ lock และเก็บผลพร้อม version ที่ใช้คำนวณ
+    # ผู้อ่านที่เริ่มก่อน add() จึงเขียนผลเก่าทับผลของ version ใหม่ไม่ได้
+    def fleet_status(self):
+        with self._lock:
+            version, points = self.version, self.points
+            cached_version, status = self._status
+        if cached_version == version:
+            return status
+        if points.empty:
+            status = pd.DataFrame(columns=KEY_COLUMNS + ['points', 'failed', 'max_abs_error', 'verdict'])
+        else:
+            summary = summarize(points)
+            status = summary.sort_values('cal_date').groupby('sensor_id').tail(1).reset_index(drop=True)
+        with self._lock:
+            if self._status[0] is None or self._status[0] < version:
+                self._status = (version, status)
+        return status
@@ -0,0 +1,99 @@
+import time
+
+import numpy as np
+
+# ==========================================
+# Chiller Engine: คำนวณ Heat Balance / kW/RT / Approach Temp แบบ Vectorized
+# รับ array ของ CQ1-CQ7 ได้ทุก shape (เช่น [chiller, timestamp]) คำนวณทีเดียวทั้งชุด
+# หน่วย: อุณหภูมิ °F, Flow เป็น US GPM, Power เป็น kW
+# ==========================================
+
+BTU_PER_TON = 12000.0
+KW_PER_TON = 3.5169
+HEAT_BALANCE_LIMIT = 5.0  # เกณฑ์การยอมรับ ±5%
+
+
+# --- หาร array โดยให้ผลเป็น NaN เมื่อตัวหารเป็น 0 (ไม่มี Warning) ---
+def _safe_divide(num, den):
+    num, den = np.broadcast_arrays(np.asarray(num, dtype=np.float64), np.asarray(den, dtype=np.float64))
+    out = np.full(num.shape, np.nan)
+    np.divide(num, den, out=out, where=den != 0)
+    return out
+
+
+# --- Cooling Load (Ton) = 500 x GPM x Delta T / 12,000 ---
+def tons(gpm, delta_t):
+    return 500.0 * np.asarray(gpm, dtype=np.float64) * np.asarray(delta_t, dtype=np.float64) / BTU_PER_TON
+
+
+def compute(cq1, cq2, cq3, cq4, evap_gpm, cond_gpm, power_kw,
+            evap_refrigerant_temp=None, cond_refrigerant_temp=None,
+            limit=HEAT_BALANCE_LIMIT):
+    cq1 = np.asarray(cq1, dtype=np.float64)
+    cq2 = np.asarray(cq2, dtype=np.float64)
+    cq3 = np.asarray(cq3, dtype=np.float64)
+    cq4 = np.asarray(cq4, dtype=np.float64)
+    power_kw = np.asarray(power_kw, dtype=np.float64)
+
+    # Qevap: น้ำเข้า Evaporator (CQ2) - น้ำออก (CQ4), Qcond: น้ำออก Condenser (CQ3) - น้ำเข้า (CQ1)
+    q_evap = tons(evap_gpm, cq2 - cq4)
+    q_cond = tons(cond_gpm, cq3 - cq1)
+    w_input = power_kw / KW_PER_TON
+
+    heat_balance = _safe_divide((q_evap + w_input) - q_cond, q_cond) * 100.0
+    result = {
+        'q_evap': q_evap,
+        'q_cond': q_cond,
+        'w_input': w_input,
+        'heat_balance': heat_balance,
+        'heat_balance_pass': np.abs(heat_balance) <= limit,
+        'kw_per_rt': _safe_divide(power_kw, q_evap),
+    }
+
+    # Approach Temp: ต่อเมื่อมีค่า Refrigerant Temp จากหน้าจอ HMI
+    if evap_refrigerant_temp is not None:
+        result['evap_approach'] = cq4 - np.asarray(evap_refrigerant_temp, dtype=np.float64)
+    if cond_refrigerant_temp is not None:
+        result['cond_approach'] = np.asarray(cond_refrigerant_temp, dtype=np.float64) - cq3
+    return result
+
+
+# --- สรุปผลรายเครื่อง (แกนสุดท้ายคือเวลา) สำหรับแสดงบน Dashboard ---
+def summarize(result, axis=-1):
+    return {
+        'heat_balance': np.nanmean(result['heat_balance'], axis=axis),
+        'heat_balance_pass_rate': np.mean(result['heat_balance_pass'], axis=axis) * 100.0,
+        'kw_per_rt': np.nanmean(result['kw_per_rt'], axis=axis),
+        'q_evap': np.nanmean(result['q_evap'], axis=axis),
+    }
+
+
+# --- Benchmark: python chiller_engine.py [chillers] [timestamps] ---
+def benchmark(n_chillers=100, n_times=100_000, repeat=5, seed=0):
+    rng = np.random.default_rng(seed)
+    shape = (n_chillers, n_times)
+    cq2 = rng.normal(54.0, 0.5, shape)
+    cq4 = rng.normal(44.0, 0.5, shape)
+    cq1 = rng.normal(85.0, 0.5, shape)
+    cq3 = rng.normal(95.0, 0.5, shape)
+    evap_gpm = rng.normal(1200.0, 20.0, shape)
+    cond_gpm = rng.normal(1500.0, 20.0, shape)
+    power_kw = rng.normal(380.0, 10.0, shape)
+    evap_ref = rng.normal(42.0, 0.3, shape)
+    cond_ref = rng.normal(97.0, 0.3, shape)
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compute(cq1, cq2, cq3, cq4, evap_gpm, cond_gpm, power_kw, evap_ref, cond_ref)
+        best = min(best, time.perf_counter() - start)
+    samples = n_chillers * n_times
+    return samples, best, samples / best
+
+
+if __name__ == '__main__':
+    import sys
+
+    args = [int(a) for a in sys.argv[1:3]]
+    samples, seconds, rate = benchmark(*args)
+    print(f"{samples:,} samples in {seconds * 1000:.1f} ms -> {rate / 1e6:.1f} M samples/s")
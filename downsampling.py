@@ -0,0 +1,254 @@
+import threading
+
+import numpy as np
+
+# ==========================================
+# Downsampling: ลดจำนวนจุดก่อนส่งไปวาดกราฟ ให้ทุกกราฟได้จุดไม่เกินที่กำหนด
+# - min/max ต่อ bucket และ LTTB (คงรูปร่าง Peak / Dip ของสัญญาณไว้)
+# - Rollup Pyramid (1 นาที / 15 นาที / 1 ชั่วโมง) อัปเดตทีละ Batch จาก TelemetryHub
+# ==========================================
+
+# (ขนาด bucket วินาที, จำนวน bucket ที่เก็บ) = 1 นาที x 7 วัน, 15 นาที x 90 วัน, 1 ชั่วโมง x 2 ปี
+ROLLUP_LEVELS = ((60, 7 * 1440), (900, 90 * 96), (3600, 2 * 365 * 24))
+PIXELS_PER_POINT = 1
+OVERSAMPLE = 4
+RAW_MAX_SAMPLES = 6 * 3600  # ช่วงไม่เกิน 6 ชั่วโมง (1 Hz) อ่านข้อมูลดิบแล้วลดจุดเอง
+
+
+# --- จำนวนจุดสูงสุดตามความกว้างของกราฟ ---
+def max_points(width_px, pixels_per_point=PIXELS_PER_POINT):
+    return max(2, int(width_px // pixels_per_point))
+
+
+# --- เลือกระดับ: 0 = ข้อมูลดิบ ไม่เช่นนั้นคืนขนาด bucket ของ Rollup ที่ละเอียดที่สุดที่ยังไม่เกิน n_points x OVERSAMPLE ---
+# (จุดที่เกินจะถูกลดด้วย min/max อีกชั้น จึงคงรายละเอียดได้มากกว่าการเลือกระดับหยาบทันที)
+def choose_level(seconds, n_points, sample_interval=1.0, levels=ROLLUP_LEVELS):
+    if seconds / sample_interval <= RAW_MAX_SAMPLES:
+        return 0
+    for step, _ in levels:
+        if seconds / step <= n_points * OVERSAMPLE:
+            return step
+    return levels[-1][0]
+
+
+# --- Min/Max ต่อ bucket: คืน index ของจุดต่ำสุดและสูงสุดในแต่ละ bucket (เรียงตามเวลา) ---
+def minmax_indices(y, n_buckets):
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= 2 * n_buckets:
+        return np.arange(n)
+    k = -(-n // n_buckets)
+    n_buckets = -(-n // k)
+    padded = np.full(n_buckets * k, np.nan)
+    padded[:n] = y
+    blocks = padded.reshape(n_buckets, k)
+    base = np.arange(n_buckets) * k
+    lo = base + np.where(np.isnan(blocks), np.inf, blocks).argmin(axis=1)
+    hi = base + np.where(np.isnan(blocks), -np.inf, blocks).argmax(axis=1)
+    idx = np.stack([np.minimum(lo, hi), np.maximum(lo, hi)], axis=1).ravel()
+    idx = idx[idx < n]
+    return idx[np.concatenate([[True], idx[1:] != idx[:-1]])]
+
+
+def minmax(x, y, n_points):
+    idx = minmax_indices(y, max(1, n_points // 2))
+    return np.asarray(x)[idx], np.asarray(y)[idx]
+
+
+# --- LTTB (Largest-Triangle-Three-Buckets) ---
+# ลำดับ bucket ต้องทำต่อกัน (จุดที่เลือกขึ้นกับ bucket ก่อนหน้า) จึงวนตาม bucket
+# แต่การหาพื้นที่สามเหลี่ยมภายใน bucket ทำแบบ Vectorized ต้นทุนรวมจึงเป็น O(n)
+# y ต้องไม่มี NaN (lttb() ตัดออกให้ก่อน)
+def lttb_indices(x, y, n_out):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # ค่าเฉลี่ยของแต่ละ bucket (ใช้เป็นจุดยอดที่ 3) คำนวณครั้งเดียวด้วย reduceat
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    avg_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    avg_x = np.append(avg_x, x[-1])
+    avg_y = np.append(avg_y, y[-1])
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        bx, by = x[lo:hi], y[lo:hi]
+        area = np.abs((x[a] - avg_x[i + 1]) * (by - y[a]) - (x[a] - bx) * (avg_y[i + 1] - y[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+
+def lttb(x, y, n_out):
+    x, y = np.asarray(x), np.asarray(y)
+    valid = np.flatnonzero(~np.isnan(y))
+    idx = valid[lttb_indices(x[valid], y[valid], n_out)]
+    return x[idx], y[idx]
+
+
+class RollupLevel:
+    # Ring ของ bucket: ช่อง slot = bucket_id % capacity ถ้า id ในช่องไม่ตรงแปลว่าเป็นข้อมูลเก่า
+    def __init__(self, step, capacity, n_channels):
+        self.step = step
+        self.capacity = capacity
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.sums = np.zeros((capacity, n_channels))
+        self.counts = np.zeros((capacity, n_channels))
+        self.mins = np.full((capacity, n_channels), np.inf)
+        self.maxs = np.full((capacity, n_channels), -np.inf)
+
+    def update(self, times, values):
+        ids = (times // self.step).astype(np.int64)
+        slots = ids % self.capacity
+        # id ใหม่สุดของแต่ละช่องชนะเสมอ: ข้อมูลที่เก่ากว่า bucket ในช่อง (เช่น Backfill ย้อนหลัง) ไม่ล้าง bucket ที่ใหม่กว่า
+        newest = self.ids.copy()
+        np.maximum.at(newest, slots, ids)
+        stale = np.unique(slots[newest[slots] != self.ids[slots]])
+        if len(stale):
+            self.sums[stale] = 0.0
+            self.counts[stale] = 0.0
+            self.mins[stale] = np.inf
+            self.maxs[stale] = -np.inf
+            self.ids[stale] = newest[stale]
+
+        valid = ~np.isnan(values)
+        keep = self.ids[slots] == ids
+        slots, values, valid = slots[keep], values[keep], valid[keep]
+        np.add.at(self.sums, slots, np.where(valid, values, 0.0))
+        np.add.at(self.counts, slots, valid)
+        np.minimum.at(self.mins, slots, np.where(valid, values, np.inf))
+        np.maximum.at(self.maxs, slots, np.where(valid, values, -np.inf))
+
+    def query(self, start, end):
+        ids = np.arange(int(start // self.step), int(np.ceil(end / self.step)), dtype=np.int64)
+        ids = ids[-self.capacity:]
+        slots = ids % self.capacity
+        found = self.ids[slots] == ids
+        ids, slots = ids[found], slots[found]
+        counts = self.counts[slots]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(counts > 0, self.sums[slots] / counts, np.nan)
+        empty = counts == 0
+        return {
+            'time': ids.astype(np.float64) * self.step,
+            'mean': mean,
+            'min': np.where(empty, np.nan, self.mins[slots]),
+            'max': np.where(empty, np.nan, self.maxs[slots]),
+            'count': counts,
+        }
+
+
+class RollupPyramid:
+    def __init__(self, channels, levels=ROLLUP_LEVELS):
+        self.channels = tuple(channels)
+        self.levels = levels
+        self.sites = {}
+        self._lock = threading.Lock()
+
+    # --- Callback จาก TelemetryHub ---
+    def update(self, site, times, values):
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64).reshape(len(times), len(self.channels))
+        with self._lock:
+            levels = self.sites.get(site)
+            if levels is None:
+                levels = self.sites[site] = {
+                    step: RollupLevel(step, capacity, len(self.channels)) for step, capacity in self.levels
+                }
+            for level in levels.values():
+                level.update(times, values)
+
+    def query(self, site, step, start, end):
+        levels = self.sites.get(site)
+        if levels is None or step not in levels:
+            return None
+        with self._lock:
+            return levels[step].query(start, end)
+
+    # --- เติม Rollup จาก History Store ตอนเปิด Server (อ่านทีละวัน) ---
+    def backfill(self, store, site, start, end, chunk=86400):
+        t = start
+        while t < end:
+            data = store.query(site, t, min(t + chunk, end), list(self.channels))
+            if len(data['time']):
+                self.update(site, data['time'], np.column_stack([data[c] for c in self.channels]))
+            t += chunk
+
+
+# --- รวม bucket ของ Rollup ทีละ k ช่องติดกัน: min ของ min, max ของ max, ค่าเฉลี่ยถ่วงด้วยจำนวน sample ---
+def merge_buckets(times, mean, lo, hi, counts, k):
+    starts = np.arange(0, len(times), k)
+    weighted = np.add.reduceat(np.where(counts > 0, mean * counts, 0.0), starts)
+    total = np.add.reduceat(counts, starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(total > 0, weighted / total, np.nan)
+    return times[starts], mean, np.fmin.reduceat(lo, starts), np.fmax.reduceat(hi, starts), total
+
+
+# --- ดึงข้อมูลสำหรับกราฟ Trend: เลือกแหล่ง/ความละเอียดจากช่วงเวลาและความกว้างกราฟ ---
+# ช่วงสั้น: ข้อมูลดิบ (Ring Buffer + History Store) แล้วลดจุดด้วย min/max
+# ช่วงยาว: Rollup ระดับที่เหมาะสม คืนค่าเฉลี่ยพร้อมกรอบ min/max ต่อ bucket ("<channel> min" / "<channel> max")
+# Peak / Dip สั้นๆ จึงยังเห็นในกราฟช่วงยาว  ทุกเส้นมีจุดไม่เกิน max_points(width_px) เสมอ
+# คืน (dict, step) โดย step = ขนาด bucket จริงหลังรวม (วินาที) หรือ 0 ถ้าเป็นข้อมูลดิบ
+def fetch_trend(site, start, end, columns, width_px, rollups, hub=None, store=None):
+    n = max_points(width_px)
+    step = choose_level(end - start, n)
+    idx = [rollups.channels.index(c) for c in columns]
+
+    if step == 0:
+        parts = []
+        ring_start = end
+        if hub is not None and site in hub.buffers:
+            buf = hub.buffer(site)
+            while True:
+                # คัดลอกออกจาก View (boolean index) แล้วเช็คว่าไม่ถูกเขียนทับระหว่างอ่าน ถ้าถูกทับให้อ่านใหม่
+                seq = buf.written
+                times, values = buf.latest()
+                ring_start, ring = end, None
+                if len(times):
+                    ring_start = max(start, times[0])
+                    keep = (times >= ring_start) & (times < end)
+                    ring = (times[keep], values[keep][:, idx])
+                if buf.stable(seq):
+                    break
+            if ring is not None:
+                parts.append(ring)
+        if store is not None and start < ring_start:
+            data = store.query(site, start, ring_start, columns)
+            parts.insert(0, (data['time'], np.column_stack([data[c] for c in columns])))
+        if not parts:
+            return {c: np.empty(0) for c in ['time'] + list(columns)}, step
+        times = np.concatenate([p[0] for p in parts])
+        values = np.concatenate([p[1] for p in parts])
+    else:
+        data = rollups.query(site, step, start, end)
+        if data is None:
+            return {c: np.empty(0) for c in ['time'] + list(columns)}, step
+        times, mean = data['time'], data['mean'][:, idx]
+        lo, hi, counts = data['min'][:, idx], data['max'][:, idx], data['count'][:, idx]
+        if len(times) > n:
+            k = -(-len(times) // n)
+            times, mean, lo, hi, counts = merge_buckets(times, mean, lo, hi, counts, k)
+            step *= k
+        result = {'time': times}
+        for i, c in enumerate(columns):
+            result[c] = mean[:, i]
+            result[f"{c} min"] = lo[:, i]
+            result[f"{c} max"] = hi[:, i]
+        return result, step
+
+    if len(times) > n:
+        # ใช้ index รวมของทุกคอลัมน์ แบ่งงบจุดให้เท่ากัน จำนวนรวมจึงไม่เกิน n
+        budget = max(1, n // (2 * len(columns)))
+        keep = np.unique(np.concatenate([minmax_indices(values[:, i], budget) for i in range(len(columns))]))
+        times, values = times[keep], values[keep]
+    result = {'time': times}
+    result.update({c: values[:, i] for i, c in enumerate(columns)})
+    return result, step
@@ -0,0 +1,238 @@
+import heapq
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# ==========================================
+# Fetchers: ดึงข้อมูลจาก Gateway / Google Sheet หลายแหล่งพร้อมกันนอก Script Thread
+# - Thread Pool จำกัดจำนวน + requests.Session ที่ใช้ Connection ซ้ำ (keep-alive)
+# - แต่ละแหล่งมีรอบเวลา / timeout / retry (backoff) / circuit breaker ของตัวเอง
+# - ผลลัพธ์เก็บใน Cache กลาง หน้าเว็บอ่านได้ทันทีโดยไม่ต้องรอ network
+# ==========================================
+
+MAX_WORKERS = 8
+DEFAULT_INTERVAL = 60
+DEFAULT_TIMEOUT = 10
+DEFAULT_RETRIES = 2
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+BREAKER_THRESHOLD = 5     # ล้มเหลวติดกันกี่รอบถึงตัดวงจร
+BREAKER_COOLDOWN = 300    # ตัดวงจรนานเท่าไรก่อนลองใหม่ (วินาที)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+
+class Source:
+    def __init__(self, name, url, interval=DEFAULT_INTERVAL, timeout=DEFAULT_TIMEOUT,
+                 retries=DEFAULT_RETRIES, parse=None, on_result=None, headers=None):
+        self.name = name
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        self.retries = retries
+        self.parse = parse or (lambda resp: resp.content)
+        self.on_result = on_result
+        self.headers = headers or {}
+
+
+class Result:
+    __slots__ = ('value', 'fetched_at', 'error', 'status', 'elapsed')
+
+    def __init__(self, value=None, fetched_at=None, error=None, status=None, elapsed=None):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.error = error
+        self.status = status
+        self.elapsed = elapsed
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return CLOSED
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return HALF_OPEN
+        return OPEN
+
+    def allow(self):
+        return self.state != OPEN
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        self.failures += 1
+        # Half-open แล้วยังล้มเหลว หรือล้มเหลวติดกันครบเกณฑ์ = เปิดวงจรใหม่
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+# pool_connections = จำนวน Host ที่เก็บ Connection Pool ไว้, pool_maxsize = Connection ต่อ Host (ได้ถึงจำนวน Worker)
+def make_session(max_workers=MAX_WORKERS, hosts=1):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max(1, hosts), pool_maxsize=max_workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class FetcherPool:
+    def __init__(self, sources=(), max_workers=MAX_WORKERS, session=None,
+                 breaker_threshold=BREAKER_THRESHOLD, breaker_cooldown=BREAKER_COOLDOWN):
+        self.sources = {}
+        self.results = {}
+        self.breakers = {}
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        sources = list(sources)
+        self.session = session or make_session(max_workers, len({urlsplit(s.url).netloc for s in sources}))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetcher")
+        self._queue = []          # heap ของ (เวลาที่ถึงรอบ, ชื่อ)
+        self._running = set()     # แหล่งที่กำลังดึงอยู่ (กันดึงซ้อน)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        for source in sources:
+            self.add(source)
+
+    def add(self, source):
+        with self._lock:
+            self.sources[source.name] = source
+            self.breakers[source.name] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+            heapq.heappush(self._queue, (time.monotonic(), source.name))
+        self._wake.set()
+
+    # --- ฝั่งหน้าเว็บ: อ่านผลล่าสุด (ไม่ block) ---
+    def get(self, name):
+        return self.results.get(name)
+
+    def status(self):
+        rows = []
+        for name, source in self.sources.items():
+            result = self.results.get(name) or Result()
+            rows.append({
+                'Source': name,
+                'Circuit': self.breakers[name].state,
+                'Last Fetch': result.fetched_at,
+                'Status': result.status,
+                'Elapsed (s)': result.elapsed,
+                'Error': result.error,
+            })
+        return rows
+
+    # --- ดึง 1 ครั้ง พร้อม retry แบบ exponential backoff + jitter ---
+    def fetch(self, source):
+        error, status, elapsed = None, None, None
+        for attempt in range(source.retries + 1):
+            if attempt:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (attempt - 1)))
+                if self._stop.wait(delay * random.uniform(0.5, 1.5)):
+                    break
+            start = time.monotonic()
+            try:
+                resp = self.session.get(source.url, headers=source.headers, timeout=source.timeout)
+                # 4xx (ยกเว้น 429) ลองใหม่ไปก็ไม่หาย ให้จบเลย
+                if 400 <= resp.status_code < 500 and resp.status_code != 429:
+                    resp.raise_for_status()
+                if resp.status_code >= 400:
+                    error, status, elapsed = f"HTTP {resp.status_code}", resp.status_code, time.monotonic() - start
+                    continue
+                return Result(source.parse(resp), time.time(), None, resp.status_code, time.monotonic() - start)
+            except requests.HTTPError as e:
+                return Result(None, time.time(), str(e), e.response.status_code, time.monotonic() - start)
+            except Exception as e:
+                error, status, elapsed = f"{type(e).__name__}: {e}", None, time.monotonic() - start
+        # คืน HTTP status / เวลาของรอบสุดท้าย ให้หน้า Admin เห็นว่าล้มเหลวด้วยอะไร
+        return Result(None, time.time(), error, status, elapsed)
+
+    def _run_source(self, name):
+        source = self.sources[name]
+        breaker = self.breakers[name]
+        try:
+            result = self.fetch(source)
+            previous = self.results.get(name)
+            if result.error is None:
+                breaker.success()
+                self.results[name] = result
+                if source.on_result is not None:
+                    source.on_result(result.value)
+            else:
+                breaker.failure()
+                # เก็บค่าเดิมไว้ให้หน้าเว็บใช้ต่อ แต่บันทึก error ล่าสุด
+                value = previous.value if previous is not None else None
+                fetched_at = previous.fetched_at if previous is not None else None
+                self.results[name] = Result(value, fetched_at, result.error, result.status, result.elapsed)
+        finally:
+            with self._lock:
+                self._running.discard(name)
+                heapq.heappush(self._queue, (time.monotonic() + source.interval, name))
+            self._wake.set()
+
+    # --- Scheduler: ส่งงานเข้า Pool เมื่อถึงรอบของแต่ละแหล่ง ---
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._schedule, name="fetcher-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def _schedule(self):
+        while not self._stop.is_set():
+            with self._lock:
+                now = time.monotonic()
+                while self._queue and self._queue[0][0] <= now:
+                    _, name = heapq.heappop(self._queue)
+                    if name in self._running or name not in self.sources:
+                        continue
+                    if not self.breakers[name].allow():
+                        # วงจรเปิดอยู่: เลื่อนไปเช็คใหม่รอบหน้า
+                        heapq.heappush(self._queue, (now + self.sources[name].interval, name))
+                        continue
+                    self._running.add(name)
+                    self._executor.submit(self._run_source, name)
+                wait = self._queue[0][0] - now if self._queue else None
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+
+# --- อ่านรายการแหล่งข้อมูลจากไฟล์ JSON: [{"name": ..., "url": ..., "interval": 30, "kind": "telemetry"}] ---
+def load_sources(path, handlers=None):
+    handlers = handlers or {}
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    sources = []
+    for item in config:
+        on_result = handlers.get(item.get('kind'))
+        sources.append(Source(
+            item['name'],
+            item['url'],
+            interval=item.get('interval', DEFAULT_INTERVAL),
+            timeout=item.get('timeout', DEFAULT_TIMEOUT),
+            retries=item.get('retries', DEFAULT_RETRIES),
+            parse=lambda resp: resp.text,
+            on_result=on_result,
+            headers=item.get('headers'),
+        ))
+    return sources
@@ -0,0 +1,288 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# ==========================================
+# History Store: เก็บค่าย้อนหลัง (CQ1-CQ7 และค่าที่คำนวณได้) เป็นไฟล์ Parquet บีบอัด
+# แบ่งโฟลเดอร์ตาม Site และวัน (UTC):  <root>/site=<ชื่อ>/date=YYYY-MM-DD/part-*.parquet
+# Query จะข้ามโฟลเดอร์ที่อยู่นอกช่วงเวลา / Site และอ่านเฉพาะคอลัมน์ที่ต้องการ
+# Thread เขียนไฟล์รวมไฟล์ย่อยของแต่ละวันเป็นไฟล์เดียวตามรอบ (1 ไฟล์ต่อวัน เมื่อวันนั้นจบแล้ว)
+# ==========================================
+
+DAY = 86400
+FLUSH_ROWS = 3600        # เขียนไฟล์เมื่อสะสมครบ 1 ชั่วโมงที่ 1 Hz
+FLUSH_INTERVAL = 300     # หรือทุก 5 นาที (วินาที)
+COMPACT_INTERVAL = 600   # รอบการรวมไฟล์ (วินาที)
+COMPACT_PARTS = 12       # วันปัจจุบัน: รวมไฟล์เมื่อมีไฟล์ย่อยถึงจำนวนนี้
+COMPRESSION = 'zstd'
+ROW_GROUP_SIZE = 65536
+
+logger = logging.getLogger(__name__)
+
+
+def _site_dir(root, site):
+    return os.path.join(root, f"site={quote(str(site), safe='')}")
+
+
+def _day_name(day):
+    return f"date={time.strftime('%Y-%m-%d', time.gmtime(day * DAY))}"
+
+
+def _parse_day(name):
+    return int(np.datetime64(name[len('date='):], 'D').astype(np.int64))
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class _SharedLock:
+    # Query หลายตัวอ่านพร้อมกันได้ (shared) ส่วนการสลับไฟล์ตอน compact ต้องรอให้ไม่มีใครอ่านอยู่ (exclusive)
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+
+    @contextmanager
+    def shared(self):
+        with self._cond:
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self._cond:
+            while self._readers:
+                self._cond.wait()
+            yield
+
+
+class _SiteBuffer:
+    # Buffer จองไว้ล่วงหน้า สะสมข้อมูลก่อนเขียนเป็นไฟล์ทีเดียว
+    def __init__(self, columns, capacity):
+        self.columns = tuple(columns)
+        self.times = np.empty(capacity)
+        self.values = np.empty((capacity, len(self.columns)))
+        self.size = 0
+        self.started = time.monotonic()
+
+    def append(self, times, values):
+        n = min(len(times), len(self.times) - self.size)
+        self.times[self.size:self.size + n] = times[:n]
+        self.values[self.size:self.size + n] = values[:n]
+        self.size += n
+        return n
+
+    # --- เขียนไฟล์ไม่สำเร็จ: เก็บเฉพาะแถวที่ยังไม่ได้เขียน และขยายที่ว่างให้รับข้อมูลต่อได้จนกว่าจะเขียนได้ ---
+    def retain(self, keep, grow):
+        kept = int(keep.sum())
+        capacity = max(len(self.times), kept + grow)
+        times, values = np.empty(capacity), np.empty((capacity, len(self.columns)))
+        times[:kept] = self.times[:self.size][keep]
+        values[:kept] = self.values[:self.size][keep]
+        self.times, self.values, self.size = times, values, kept
+
+
+class HistoryStore:
+    def __init__(self, root, columns, flush_rows=FLUSH_ROWS, flush_interval=FLUSH_INTERVAL,
+                 compact_interval=COMPACT_INTERVAL):
+        self.root = root
+        self.columns = tuple(columns)
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.buffers = {}
+        self._lock = threading.Lock()
+        self._files = _SharedLock()
+        self._compacted = set()   # (site, day) ของวันที่จบแล้วและเหลือไฟล์เดียว ไม่ต้องสแกนซ้ำ
+        self._seq = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- ฝั่งเขียน: ใช้เป็น Callback ของ TelemetryHub ได้โดยตรง ---
+    def append(self, site, times, values):
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64).reshape(len(times), len(self.columns))
+        with self._lock:
+            start = 0
+            while start < len(times):
+                buf = self.buffers.get(site)
+                if buf is None:
+                    buf = self.buffers[site] = _SiteBuffer(self.columns, self.flush_rows)
+                start += buf.append(times[start:], values[start:])
+                if buf.size == len(buf.times):
+                    # ฝั่งรับข้อมูล (Callback ของ TelemetryHub) ห้ามโยน Error ไม่เช่นนั้น Callback ถัดไปจะไม่ได้ข้อมูลชุดนี้
+                    try:
+                        self._flush_site(site)
+                    except Exception:
+                        logger.exception("history: flush failed for site %s, keeping rows in memory", site)
+
+    # Buffer ถูกลบออกหลังเขียนครบทุกวันแล้วเท่านั้น เขียนไม่สำเร็จ = ข้อมูลที่ยังไม่ได้เขียนยังอยู่ใน Buffer (ลองใหม่รอบถัดไป)
+    def _flush_site(self, site):
+        buf = self.buffers.get(site)
+        if buf is None or buf.size == 0:
+            self.buffers.pop(site, None)
+            return
+        times, values = buf.times[:buf.size], buf.values[:buf.size]
+        days = (times // DAY).astype(np.int64)
+        written = []
+        # ข้อมูลชุดเดียวอาจคร่อมเที่ยงคืน: แยกเขียนตามวัน
+        for day in np.unique(days):
+            mask = days == day
+            order = np.argsort(times[mask], kind='stable')
+            arrays = [pa.array(times[mask][order])] + [pa.array(values[mask][order, i]) for i in range(len(self.columns))]
+            table = pa.Table.from_arrays(arrays, names=['time'] + list(self.columns))
+            directory = os.path.join(_site_dir(self.root, site), _day_name(int(day)))
+            self._seq += 1
+            name = f"part-{int(times[mask][order][0] * 1000)}-{os.getpid()}-{self._seq}.parquet"
+            tmp = os.path.join(directory, '.' + name)
+            try:
+                os.makedirs(directory, exist_ok=True)
+                self._compacted.discard((site, int(day)))
+                pq.write_table(table, tmp, compression=COMPRESSION, row_group_size=ROW_GROUP_SIZE)
+                os.replace(tmp, os.path.join(directory, name))
+            except Exception:
+                _remove_quietly(tmp)
+                buf.retain(~np.isin(days, written), self.flush_rows)
+                raise
+            written.append(day)
+        del self.buffers[site]
+
+    # Site ที่เขียนไม่สำเร็จไม่ขวาง Site อื่นในรอบเดียวกัน (โยน Error แรกหลังครบทุก Site)
+    def flush(self, older_than=0):
+        error = None
+        with self._lock:
+            now = time.monotonic()
+            for site in list(self.buffers):
+                if now - self.buffers[site].started >= older_than:
+                    try:
+                        self._flush_site(site)
+                    except Exception as exc:
+                        error = error or exc
+        if error is not None:
+            raise error
+
+    # --- Thread เขียนไฟล์ตามรอบเวลา สำหรับ Site ที่ข้อมูลมาช้า ---
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="history-flush", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        last_compact = time.monotonic()
+        while not self._stop.wait(min(self.flush_interval, 30)):
+            # Error ของรอบใดรอบหนึ่ง (เช่น Disk เต็มชั่วคราว) ต้องไม่ทำให้ Thread หยุด
+            try:
+                self.flush(older_than=self.flush_interval)
+                if time.monotonic() - last_compact >= self.compact_interval:
+                    last_compact = time.monotonic()
+                    self.compact_pending()
+            except Exception:
+                logger.exception("history: flush/compact round failed, retrying next round")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    # --- รวมไฟล์ย่อยของวันเดียวกันเป็นไฟล์เดียว (อ่านเร็วขึ้น) ---
+    # ไฟล์ผลลัพธ์ได้ชื่อใหม่ทุกครั้ง และลบเฉพาะไฟล์ที่อ่านมารวม (ไฟล์ที่เขียนเข้ามาระหว่างนี้ยังอยู่)
+    def compact(self, site, day):
+        directory = os.path.join(_site_dir(self.root, site), _day_name(day))
+        parts = sorted(f for f in os.listdir(directory) if f.startswith('part-'))
+        if len(parts) <= 1:
+            return
+        table = ds.dataset([os.path.join(directory, f) for f in parts], format='parquet').to_table()
+        table = table.sort_by('time')
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        name = f"part-{int(table['time'][0].as_py() * 1000)}-compact-{os.getpid()}-{seq}.parquet"
+        tmp = os.path.join(directory, '.' + name)
+        try:
+            pq.write_table(table, tmp, compression=COMPRESSION, row_group_size=ROW_GROUP_SIZE)
+        except Exception:
+            _remove_quietly(tmp)
+            raise
+        # สลับไฟล์ตอนไม่มี Query อ่านอยู่ Query จึงไม่เห็นข้อมูลซ้ำ (ไฟล์ใหม่ + ไฟล์เดิม) หรือไฟล์หายกลางทาง
+        with self._files.exclusive():
+            os.replace(tmp, os.path.join(directory, name))
+            for f in parts:
+                os.remove(os.path.join(directory, f))
+
+    # --- รวมไฟล์ทุกวันที่จบแล้ว (และวันปัจจุบันเมื่อไฟล์ย่อยถึง COMPACT_PARTS) เรียกจาก Thread เขียนไฟล์ ---
+    def compact_pending(self, min_parts_today=COMPACT_PARTS):
+        today = int(time.time() // DAY)
+        for site in self.sites():
+            site_dir = _site_dir(self.root, site)
+            for name in os.listdir(site_dir):
+                if not name.startswith('date='):
+                    continue
+                day = _parse_day(name)
+                if (site, day) in self._compacted:
+                    continue
+                directory = os.path.join(site_dir, name)
+                count = sum(f.startswith('part-') for f in os.listdir(directory))
+                if count > 1 and (day < today or count >= min_parts_today):
+                    self.compact(site, day)
+                if day < today:
+                    # นับใหม่ภายใต้ lock ของฝั่งเขียน: ถ้ามีข้อมูลมาช้าเขียนเข้าวันนี้พอดี จะได้ไม่ถูกข้าม
+                    with self._lock:
+                        if sum(f.startswith('part-') for f in os.listdir(directory)) <= 1:
+                            self._compacted.add((site, day))
+
+    # --- ฝั่งอ่าน ---
+    def sites(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(unquote(d[len('site='):]) for d in os.listdir(self.root) if d.startswith('site='))
+
+    def files(self, site, start, end):
+        site_dir = _site_dir(self.root, site)
+        if not os.path.isdir(site_dir):
+            return []
+        first, last = int(start // DAY), int(end // DAY)
+        files = []
+        for name in sorted(os.listdir(site_dir)):
+            if not name.startswith('date='):
+                continue
+            day = _parse_day(name)
+            if first <= day <= last:
+                directory = os.path.join(site_dir, name)
+                files.extend(os.path.join(directory, f) for f in sorted(os.listdir(directory)) if f.startswith('part-'))
+        return files
+
+    # คืน dict ของ numpy array: {'time': ..., <column>: ...} เรียงตามเวลา
+    def query(self, site, start, end, columns=None):
+        columns = list(self.columns if columns is None else columns)
+        with self._files.shared():
+            files = self.files(site, start, end)
+            if not files:
+                return {c: np.empty(0) for c in ['time'] + columns}
+            dataset = ds.dataset(files, format='parquet')
+            expr = (ds.field('time') >= start) & (ds.field('time') < end)
+            table = dataset.to_table(columns=['time'] + columns, filter=expr)
+        result = {name: table[name].to_numpy() for name in ['time'] + columns}
+        # ไฟล์ถูกอ่านตามลำดับเวลาอยู่แล้ว เรียงใหม่เฉพาะกรณีข้อมูลมาไม่ตามลำดับ
+        if np.any(np.diff(result['time']) < 0):
+            order = np.argsort(result['time'], kind='stable')
+            result = {name: values[order] for name, values in result.items()}
+        return result
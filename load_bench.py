@@ -0,0 +1,172 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# ==========================================
+# Load Benchmark: จำลองผู้ใช้ N Session ด้วย Streamlit AppTest
+# แต่ละ Session: Login -> สลับหน้า -> ส่ง Quiz วนหลายรอบ แล้วสรุป Throughput / Tail Latency
+#
+# ข้อจำกัด:
+# - AppTest ใช้ Runtime ร่วมกันทั้ง Process จึงรันได้ 1 Session ต่อ Process ในเวลาเดียวกัน
+#   รันพร้อมกันจริงแค่ --workers Session ที่เหลือต่อคิวในแต่ละ Worker
+# - แต่ละ Worker มี st.cache_resource ของตัวเอง (Registry / User Directory / Hub ไม่ได้ใช้ร่วมกันข้าม Worker)
+#   จึงไม่ได้วัดการแย่ง lock ของ State ที่ใช้ร่วมกันบน Server จริง ดูส่วนนั้นจากหน้า "⏱️ Rerun Profiling" ของ Admin
+#
+# Gate (--max-p95) ใช้เฉพาะ Rerun ช่วงใช้งานปกติ (สลับหน้า / ส่ง Quiz) แยกรายการ
+# open (Cold start) และ login (มี time.sleep(1) ในหน้า Login) แสดงผลแยก ไม่นับใน Gate
+#
+#   python load_bench.py --sessions 20 --workers 4 --iterations 5
+#   python load_bench.py --sessions 20 --workers 4 --max-p95 800   (p95 เกินกี่ ms ให้ exit 1 สำหรับ CI)
+# ==========================================
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+PAGES = ["Dashboard ภาพรวม", "Learning Academy (บทเรียน)", "Quiz ทดสอบความรู้"]
+BENCH_USER, BENCH_PASSWORD = 'bench', 'bench'
+WARMUP_ACTIONS = ('open', 'login')
+STEADY_ACTIONS = ('switch_page', 'submit_quiz')
+
+
+# --- เตรียมข้อมูลจำลอง: รายชื่อสมาชิก (ไม่ต้องต่อ Google Sheet) และโฟลเดอร์ข้อมูลชั่วคราว ---
+def prepare_environment(workdir, role):
+    users = os.path.join(workdir, 'users.csv')
+    with open(users, 'w', encoding='utf-8') as f:
+        f.write("Timestamp,Username,Password,Name,Role\n")
+        f.write(f"2026-01-01,{BENCH_USER},{BENCH_PASSWORD},Load Bench,{role}\n")
+    os.environ['SENSOR_USERS_SOURCE'] = users
+    os.environ['SENSOR_DATA_DIR'] = os.path.join(workdir, 'data')
+    os.environ.setdefault('SENSOR_TELEMETRY_SOURCE', '')
+    os.environ.setdefault('SENSOR_FEEDS', '')
+
+
+class Timings:
+    def __init__(self):
+        self.samples = {}
+        self.errors = 0
+
+    def add(self, action, seconds):
+        self.samples.setdefault(action, []).append(seconds)
+
+    def error(self):
+        self.errors += 1
+
+    def merge(self, samples, errors):
+        for action, values in samples.items():
+            self.samples.setdefault(action, []).extend(values)
+        self.errors += errors
+
+
+def timed_run(at, timings, action, timeout):
+    start = time.perf_counter()
+    at.run(timeout=timeout)
+    timings.add(action, time.perf_counter() - start)
+    if at.exception:
+        timings.error()
+
+
+def simulate_session(timings, iterations, timeout, seed):
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed)
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    timed_run(at, timings, 'open', timeout)
+
+    at.text_input(key='login_user').input(BENCH_USER)
+    at.text_input(key='login_pass').input(BENCH_PASSWORD)
+    at.button[0].click()
+    timed_run(at, timings, 'login', timeout)
+    if not at.session_state['logged_in']:
+        timings.error()
+        return
+    # หน้า Login มี st.rerun() หลังสำเร็จ: รันอีกรอบให้เข้าหน้าหลัก
+    timed_run(at, timings, 'login', timeout)
+
+    for _ in range(iterations):
+        for page in PAGES:
+            at.sidebar.radio[0].set_value(page)
+            timed_run(at, timings, 'switch_page', timeout)
+
+        # ตอบ Quiz แบบสุ่มแล้วกดส่ง
+        for radio in at.main.radio:
+            radio.set_value(rng.choice(radio.options))
+        submit = [b for b in at.button if b.label == "ส่งคำตอบ"]
+        if submit:
+            submit[0].click()
+            timed_run(at, timings, 'submit_quiz', timeout)
+
+
+# --- งานของแต่ละ Worker Process: รัน Session ที่ได้รับทีละ Session ---
+# (AppTest แทนที่ __main__ ระหว่างรัน จึงส่งผลกลับเป็น dict / int ธรรมดา ไม่ใช่ Timings)
+def run_worker(seeds, iterations, timeout):
+    timings = Timings()
+    for seed in seeds:
+        try:
+            simulate_session(timings, iterations, timeout, seed)
+        except Exception:
+            timings.error()
+    return timings.samples, timings.errors
+
+
+def summarize(timings, actions):
+    rows = []
+    for action in actions:
+        values = timings.samples.get(action)
+        if values:
+            ms = np.asarray(values) * 1000
+            rows.append((action, len(ms), *np.percentile(ms, [50, 95, 99]), ms.max()))
+    return rows
+
+
+def print_rows(title, rows):
+    print(f"{title:<12} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for action, n, p50, p95, p99, mx in rows:
+        print(f"{action:<12} {n:>6} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {mx:>9.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-session load benchmark (Streamlit AppTest)")
+    parser.add_argument('--sessions', type=int, default=10, help="จำนวน Session ทั้งหมด (แบ่งให้ Worker รันต่อคิวกัน)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="จำนวน Session ที่รันพร้อมกันจริง (1 Process ต่อ Session)")
+    parser.add_argument('--iterations', type=int, default=3, help="จำนวนรอบสลับหน้า + ส่ง Quiz ต่อ Session")
+    parser.add_argument('--role', default='User', choices=['User', 'Admin'])
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--max-p95', type=float, default=None, help="p95 (ms) สูงสุดที่ยอมรับได้ของแต่ละ Action ช่วงใช้งานปกติ เกินแล้ว exit 1")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='sensor-bench-') as workdir:
+        prepare_environment(workdir, args.role)
+        workers = max(1, min(args.workers, args.sessions))
+        timings = Timings()
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(run_worker, list(range(w, args.sessions, workers)), args.iterations, args.timeout)
+                for w in range(workers)
+            ]
+            for future in futures:
+                timings.merge(*future.result())
+        wall = time.perf_counter() - start
+
+    reruns = sum(len(v) for v in timings.samples.values())
+    print(f"sessions={args.sessions} concurrent={workers} (1 per worker process) iterations={args.iterations} "
+          f"wall={wall:.1f}s reruns={reruns} throughput={reruns / wall if wall > 0 else 0.0:.1f} reruns/s "
+          f"errors={timings.errors}")
+    print_rows("warm-up", summarize(timings, WARMUP_ACTIONS))
+    steady = summarize(timings, STEADY_ACTIONS)
+    print_rows("steady", steady)
+
+    if not steady or timings.errors:
+        return 1
+    failed = [(action, p95) for action, _, _, p95, _, _ in steady if args.max_p95 is not None and p95 > args.max_p95]
+    for action, p95 in failed:
+        print(f"FAIL: {action} p95 {p95:.1f} ms > {args.max_p95:.1f} ms")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
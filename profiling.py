@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+# ==========================================
+# Profiling: จับเวลาแต่ละส่วนของการ Rerun และการเรียก I/O
+# เก็บเป็น Histogram แบบ bucket คงที่ (หน่วยความจำคงที่ ไม่ว่าจะรันกี่ครั้ง)
+# ทั้งแบบรวมทั้ง Server และแยกต่อ Session
+# ==========================================
+
+# ขอบ bucket แบบ log: 10 µs ถึง 100 s ละเอียด 20 ช่องต่อ 10 เท่า (คลาดเคลื่อน ~12%)
+BUCKET_BOUNDS = np.logspace(-5, 2, 7 * 20 + 1)
+MAX_SESSIONS = 500
+RERUN = 'rerun'
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = np.zeros(len(BUCKET_BOUNDS) + 1, dtype=np.int64)
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[np.searchsorted(BUCKET_BOUNDS, seconds)] += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    # คืนค่าขอบบนของ bucket ที่ percentile ตกอยู่ (วินาที)
+    def percentiles(self, qs=(50, 95, 99)):
+        n = self.count
+        if n == 0:
+            return [np.nan] * len(qs)
+        cumulative = np.cumsum(self.counts)
+        bounds = np.append(BUCKET_BOUNDS, np.inf)
+        values = []
+        for q in qs:
+            i = int(np.searchsorted(cumulative, np.ceil(n * q / 100.0)))
+            values.append(min(bounds[i], self.max))
+        return values
+
+    def summary(self):
+        p50, p95, p99 = self.percentiles()
+        n = self.count
+        return {
+            'count': n,
+            'mean_ms': self.total / n * 1000 if n else np.nan,
+            'p50_ms': p50 * 1000,
+            'p95_ms': p95 * 1000,
+            'p99_ms': p99 * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+
+class Profiler:
+    def __init__(self, max_sessions=MAX_SESSIONS):
+        self.spans = {}
+        self.sessions = OrderedDict()   # session_id -> Histogram ของเวลา Rerun (LRU)
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def record(self, name, seconds, session_id=None):
+        with self._lock:
+            hist = self.spans.get(name)
+            if hist is None:
+                hist = self.spans[name] = Histogram()
+            hist.record(seconds)
+            if session_id is not None and name == RERUN:
+                hist = self.sessions.pop(session_id, None) or Histogram()
+                hist.record(seconds)
+                self.sessions[session_id] = hist
+                while len(self.sessions) > self.max_sessions:
+                    self.sessions.popitem(last=False)
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    # --- ครอบการ Rerun ทั้งรอบ (st.rerun / st.stop ก็ยังบันทึกเวลา) ---
+    @contextmanager
+    def rerun(self, session_id):
+        self._local.last = time.perf_counter()
+        start = self._local.last
+        try:
+            yield
+        finally:
+            self.record(RERUN, time.perf_counter() - start, session_id)
+
+    # --- จับเวลาแบบต่อเนื่อง: lap("ชื่อ") บันทึกเวลาตั้งแต่ lap ก่อนหน้า (ไม่ต้องย่อหน้าโค้ดใหม่) ---
+    def lap(self, name):
+        now = time.perf_counter()
+        last = getattr(self._local, 'last', None)
+        if last is not None:
+            self.record(name, now - last)
+        self._local.last = now
+
+    def report(self):
+        with self._lock:
+            rows = [dict(span=name, **hist.summary()) for name, hist in self.spans.items()]
+        return sorted(rows, key=lambda r: -r['count'] * (r['mean_ms'] or 0))
+
+    def session_report(self):
+        with self._lock:
+            rows = [dict(session=sid[:8], **hist.summary()) for sid, hist in self.sessions.items()]
+        return sorted(rows, key=lambda r: -r['p95_ms'])
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# Site Map: เตรียมจุดบนแผนที่ครั้งเดียวต่อข้อมูล Site หนึ่งชุด
+# - สี/ขนาดตาม Status แบบ Vectorized (ไม่ใช้ .apply ทีละแถว)
+# - รวมกลุ่มจุดเป็น Grid หลายระดับ พร้อม Spatial Index สำหรับดึงจุดในพื้นที่
+# ==========================================
+
+# ลำดับความรุนแรง: กลุ่มที่มีหลาย Site จะแสดงสีของ Status ที่รุนแรงที่สุด
+STATUS_ORDER = ['Normal', 'Maintenance', 'Critical']
+STATUS_COLORS = np.array(['#00FF00', '#FFA500', '#FF0000', '#808080'])  # สุดท้าย = Status อื่นๆ
+STATUS_SIZES = np.array([20.0, 30.0, 40.0, 20.0])
+UNKNOWN_STATUS = len(STATUS_ORDER)
+
+# ขนาด Grid (องศา) จากละเอียดไปหยาบ ~5 km, ~20 km, ~110 km, ~550 km
+GRID_SIZES = (0.05, 0.2, 1.0, 5.0)
+METERS_PER_DEGREE = 111_000.0
+MAX_POINTS = 2000
+
+
+def status_codes(status):
+    codes = pd.Categorical(status, categories=STATUS_ORDER).codes.astype(np.int64)
+    codes[codes < 0] = UNKNOWN_STATUS
+    return codes
+
+
+class GridLevel:
+    # Spatial Index แบบ CSR: order เรียง index ของจุดตาม cell, starts[k]:starts[k+1] คือจุดใน cell k
+    def __init__(self, cell_size, lat, lon, codes):
+        self.cell_size = cell_size
+        row = np.floor(lat / cell_size).astype(np.int64)
+        col = np.floor(lon / cell_size).astype(np.int64)
+        # รวม row/col เป็น key เดียว (int64) ให้ np.unique ทำงานแบบ 1 มิติซึ่งเร็วกว่ามาก
+        keys = row * (1 << 32) + (col + (1 << 31))
+        _, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+
+        self.cells = np.stack([row[first], col[first]], axis=1)
+        self.order = np.argsort(inverse, kind='stable')
+        self.starts = np.concatenate([[0], np.cumsum(counts)])
+
+        # รวมค่าต่อ cell ด้วย bincount / maximum.at (ไม่มี loop ต่อ cell)
+        n = len(counts)
+        worst = np.full(n, -1, dtype=np.int64)
+        # Status อื่นๆ (สีเทา) ไม่ถือว่ารุนแรงกว่า Critical
+        np.maximum.at(worst, inverse, np.where(codes == UNKNOWN_STATUS, -1, codes))
+        worst[worst < 0] = UNKNOWN_STATUS
+        self.frame = pd.DataFrame({
+            'lat': np.bincount(inverse, weights=lat, minlength=n) / counts,
+            'lon': np.bincount(inverse, weights=lon, minlength=n) / counts,
+            'count': counts,
+            'critical': np.bincount(inverse, weights=codes == STATUS_ORDER.index('Critical'), minlength=n).astype(np.int64),
+            'color': STATUS_COLORS[worst],
+            # วงกลมใหญ่สุดประมาณครึ่ง cell แล้วย่อตาม sqrt(จำนวน Site)
+            'size': np.maximum(STATUS_SIZES.max(), 0.5 * cell_size * METERS_PER_DEGREE * np.sqrt(counts / counts.max())),
+        })
+
+    # --- index ของจุดทั้งหมดใน cells ที่เลือก (ต่อช่วงของ CSR ด้วย repeat/arange) ---
+    def members(self, cells):
+        starts = self.starts[cells]
+        lengths = self.starts[cells + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return self.order[offsets]
+
+    def cells_in(self, lat_min, lat_max, lon_min, lon_max):
+        lo = np.floor(np.array([lat_min, lon_min]) / self.cell_size)
+        hi = np.floor(np.array([lat_max, lon_max]) / self.cell_size)
+        mask = np.all((self.cells >= lo) & (self.cells <= hi), axis=1)
+        return np.flatnonzero(mask)
+
+
+class SiteMapLayer:
+    def __init__(self, sites, grid_sizes=GRID_SIZES):
+        sites = sites.dropna(subset=['Lat', 'Lon'])
+        lat = sites['Lat'].to_numpy(dtype=np.float64)
+        lon = sites['Lon'].to_numpy(dtype=np.float64)
+        codes = status_codes(sites['Status'])
+
+        self.points = pd.DataFrame({
+            'name': sites['Site Name'].to_numpy(),
+            'lat': lat,
+            'lon': lon,
+            'count': 1,
+            'color': STATUS_COLORS[codes],
+            'size': STATUS_SIZES[codes],
+        })
+        self.levels = [GridLevel(size, lat, lon, codes) for size in grid_sizes] if len(lat) else []
+
+    # --- เลือกระดับที่ละเอียดที่สุดที่จำนวนจุดไม่เกิน max_points ---
+    def view(self, max_points=MAX_POINTS):
+        if len(self.points) <= max_points:
+            return self.points, None
+        for level in self.levels:
+            if len(level.frame) <= max_points:
+                return level.frame, level.cell_size
+        return self.levels[-1].frame, self.levels[-1].cell_size
+
+    # --- ดึงเฉพาะพื้นที่ (เช่น ซูมเข้าจังหวัดเดียว) ผ่าน Spatial Index ---
+    def view_bounds(self, lat_min, lat_max, lon_min, lon_max, max_points=MAX_POINTS):
+        if not self.levels:
+            return self.points, None
+        finest = self.levels[0]
+        idx = np.sort(finest.members(finest.cells_in(lat_min, lat_max, lon_min, lon_max)))
+        points = self.points.iloc[idx]
+        inside = points['lat'].between(lat_min, lat_max) & points['lon'].between(lon_min, lon_max)
+        points = points[inside]
+        if len(points) <= max_points:
+            return points, None
+        for level in self.levels:
+            cells = level.cells_in(lat_min, lat_max, lon_min, lon_max)
+            if len(cells) <= max_points or level is self.levels[-1]:
+                return level.frame.iloc[cells], level.cell_size
@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+
+import pandas as pd
+
+# ==========================================
+# Site Registry: ข้อมูล Site ชุดเดียวใช้ร่วมกันทุก Session
+# ผู้อ่านได้ Snapshot (version, frame) ที่ไม่ถูกแก้ไขอีก จึงไม่ต้อง lock
+# Admin แก้ไข = สร้าง frame ใหม่ บันทึกลงไฟล์ แล้วสลับ Snapshot ทีเดียว
+# ==========================================
+
+SITE_COLUMNS = ['Site Name', 'Lat', 'Lon', 'Status']
+# ข้อมูล Chiller จากการสำรวจหน้างาน (Flow จากหน้า GUI, Power จากหน้าจอ HMI) ใช้กับกฎ Heat Balance
+PLANT_COLUMNS = ['Evap GPM', 'Cond GPM', 'Chiller kW']
+STATUSES = ['Normal', 'Critical', 'Maintenance']
+
+DEFAULT_SITES = pd.DataFrame({
+    'Site Name': ['RBS Chonburi', 'Central Ayutthaya', 'RBS Rayong', 'Robinson Saraburi'],
+    'Lat': [13.3611, 14.3532, 12.6828, 14.5290],
+    'Lon': [100.9847, 100.5700, 101.2816, 100.9130],
+    'Status': ['Normal', 'Critical', 'Maintenance', 'Normal'],
+    'Evap GPM': [None] * 4,
+    'Cond GPM': [None] * 4,
+    'Chiller kW': [None] * 4,
+})
+
+
+class Snapshot:
+    __slots__ = ('version', 'frame', 'updated_at', 'updated_by')
+
+    def __init__(self, version, frame, updated_at, updated_by):
+        self.version = version
+        self.frame = frame
+        self.updated_at = updated_at
+        self.updated_by = updated_by
+
+
+# --- ทำความสะอาดข้อมูลจาก data_editor ก่อนบันทึก ---
+def normalize(df):
+    df = df.reindex(columns=SITE_COLUMNS + PLANT_COLUMNS).copy()
+    df = df.dropna(subset=['Site Name'])
+    df['Site Name'] = df['Site Name'].astype(str).str.strip()
+    df = df[df['Site Name'] != '']
+    df['Lat'] = pd.to_numeric(df['Lat'], errors='coerce')
+    df['Lon'] = pd.to_numeric(df['Lon'], errors='coerce')
+    for column in PLANT_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors='coerce')
+    df['Status'] = df['Status'].fillna('Normal').astype(str).str.strip()
+    return df.reset_index(drop=True)
+
+
+class SiteRegistry:
+    def __init__(self, path, default=DEFAULT_SITES):
+        self.path = path
+        self.load_error = None
+        self._lock = threading.Lock()
+        self._snapshot = Snapshot(0, normalize(self._load(default)), time.time(), None)
+
+    def _load(self, default):
+        if not os.path.exists(self.path):
+            # ยังไม่มีไฟล์: เริ่มจากค่าเริ่มต้น (ไม่เขียนไฟล์จนกว่า Admin จะกด Save)
+            return default
+        try:
+            return pd.read_parquet(self.path)
+        except Exception as e:
+            # ไฟล์เสีย / ไม่มี pyarrow: ใช้ค่าเริ่มต้นไปก่อน แต่เก็บ error ไว้แสดงให้ Admin เห็น
+            self.load_error = e
+            return default
+
+    # --- ฝั่งผู้อ่าน: คืน Snapshot ปัจจุบัน (อ่าน reference ครั้งเดียว ไม่ lock) ---
+    def snapshot(self):
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    # --- เขียนไฟล์แบบ Atomic: เขียนไฟล์ชั่วคราวก่อน แล้วค่อย rename ทับ ---
+    def _persist(self, df):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, self.path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    # --- ฝั่ง Admin: บันทึกข้อมูลใหม่ทั้งชุด ---
+    # ส่ง base_version มาด้วยเพื่อกันการเขียนทับงานของ Admin คนอื่นที่ Save ไปก่อนหน้า
+    # ถ้าเขียนไฟล์ไม่สำเร็จจะ raise ออกไปโดย Snapshot เดิมไม่เปลี่ยน
+    def update(self, df, user=None, base_version=None):
+        df = normalize(df)
+        with self._lock:
+            current = self._snapshot
+            if base_version is not None and base_version != current.version:
+                return False
+            self._persist(df)
+            self._snapshot = Snapshot(current.version + 1, df, time.time(), user)
+        return True
@@ -0,0 +1,236 @@
+import os
+import socket
+import threading
+import time
+
+import numpy as np
+
+# ==========================================
+# Telemetry: รับค่าเซ็นเซอร์แบบ Streaming เก็บใน Ring Buffer (NumPy) ต่อ Site
+# สร้างครั้งเดียวต่อ Server Process ทุก Session อ่านจากชุดเดียวกัน
+# ==========================================
+
+CHANNELS = ('CQ1', 'CQ2', 'CQ3', 'CQ4', 'CQ5', 'CQ6', 'CQ7')
+DEFAULT_CAPACITY = 3600  # 1 ชั่วโมงที่ 1 Hz
+
+
+class RingBuffer:
+    # เก็บข้อมูลซ้ำ 2 ชุด (ตำแหน่ง i และ i + size) เพื่อให้หน้าต่างล่าสุดต่อเนื่องกันเสมอ
+    # ผู้อ่านจึงได้ View ของ array โดยไม่ต้อง copy แม้ buffer จะวนรอบแล้ว
+    # พื้นที่จริงเผื่อไว้ headroom ช่องเกินหน้าต่าง: View ที่อ่านไปจะไม่ถูกเขียนทับจนกว่าจะมีข้อมูลใหม่เกิน headroom ค่า
+    # (ตรวจได้ด้วย written: ถ้า written เพิ่มขึ้นเกิน headroom ระหว่างอ่าน ให้อ่านใหม่)
+    def __init__(self, capacity=DEFAULT_CAPACITY, channels=CHANNELS, headroom=None):
+        self.capacity = capacity
+        self.headroom = capacity // 4 if headroom is None else headroom
+        self.size = capacity + self.headroom
+        self.channels = tuple(channels)
+        self.times = np.full(2 * self.size, np.nan)
+        self.values = np.full((2 * self.size, len(self.channels)), np.nan)
+        self.head = 0     # ตำแหน่งที่จะเขียนครั้งถัดไป (0 .. size-1)
+        self.count = 0    # จำนวนข้อมูลที่มีอยู่ (ไม่เกิน capacity)
+        self.written = 0  # จำนวนข้อมูลที่เคยเขียนทั้งหมด (เพิ่มก่อนเขียนจริง)
+        self._lock = threading.Lock()
+
+    # --- เขียนทีละ Batch: copy เป็นช่วงๆ ไม่มีการจอง memory ต่อ sample ---
+    def extend(self, times, values):
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64).reshape(len(times), len(self.channels))
+        if len(times) > self.capacity:
+            times, values = times[-self.capacity:], values[-self.capacity:]
+
+        with self._lock:
+            n = len(times)
+            self.written += n
+            head, cap = self.head, self.size
+            first = min(n, cap - head)
+            for offset in (0, cap):
+                self.times[offset + head:offset + head + first] = times[:first]
+                self.values[offset + head:offset + head + first] = values[:first]
+                self.times[offset:offset + n - first] = times[first:]
+                self.values[offset:offset + n - first] = values[first:]
+            self.head = (head + n) % cap
+            self.count = min(self.count + n, self.capacity)
+
+    # --- อ่านหน้าต่างล่าสุด n ค่า (View แบบ read-only ไม่ copy) ---
+    # View คงที่จนกว่าจะเขียนเพิ่มอีก headroom ค่า: ผู้อ่านที่ใช้ View นานให้จำ written ก่อนอ่าน แล้วเช็ค stable()
+    def latest(self, n=None):
+        with self._lock:
+            head, count = self.head, self.count
+        n = count if n is None else min(n, count)
+        end = head + self.size
+        times = self.times[end - n:end]
+        values = self.values[end - n:end]
+        times.flags.writeable = False
+        values.flags.writeable = False
+        return times, values
+
+    # --- True ถ้า View ที่อ่านหลังจาก written == seq ยังไม่ถูกเขียนทับ ---
+    def stable(self, seq):
+        return self.written - seq <= self.headroom
+
+    def last(self):
+        if self.count == 0:
+            return None, None
+        i = (self.head - 1) % self.size
+        return self.times[i], self.values[i]
+
+
+class TelemetryHub:
+    def __init__(self, capacity=DEFAULT_CAPACITY, channels=CHANNELS):
+        self.capacity = capacity
+        self.channels = tuple(channels)
+        self.buffers = {}
+        self.samples = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def buffer(self, site):
+        buf = self.buffers.get(site)
+        if buf is None:
+            with self._lock:
+                buf = self.buffers.setdefault(site, RingBuffer(self.capacity, self.channels))
+        return buf
+
+    def sites(self):
+        return sorted(self.buffers)
+
+    # ฟังก์ชันที่ต้องการรับข้อมูลชุดใหม่ต่อ (เช่น Alerting / History) ลงทะเบียนที่นี่
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def ingest(self, site, times, values):
+        self.buffer(site).extend(times, values)
+        self.samples += len(times)
+        for callback in self._listeners:
+            callback(site, times, values)
+
+    # --- แยกบรรทัด "site,timestamp,CQ1,...,CQ7" เป็นกลุ่มตาม Site แล้วเขียนทีเดียว ---
+    # skip_seen=True: ข้ามแถวที่เวลาไม่ใหม่กว่าแถวล่าสุดของ Site นั้น (แหล่งที่ส่งข้อมูลชุดเดิมซ้ำทุกรอบ Poll)
+    def ingest_lines(self, lines, skip_seen=False):
+        sites, rows = [], []
+        width = len(self.channels) + 1
+        for line in lines:
+            parts = line.strip().split(',')
+            if len(parts) != width + 1:
+                self.errors += 1
+                continue
+            try:
+                rows.append([float(p) if p else np.nan for p in parts[1:]])
+            except ValueError:
+                self.errors += 1
+                continue
+            sites.append(parts[0])
+        if not rows:
+            return
+
+        data = np.array(rows, dtype=np.float64)
+        names, inverse = np.unique(np.array(sites), return_inverse=True)
+        for i, site in enumerate(names):
+            block = data[inverse == i]
+            if skip_seen and str(site) in self.buffers:
+                last, _ = self.buffers[str(site)].last()
+                if last is not None:
+                    block = block[block[:, 0] > last]
+                    if not len(block):
+                        continue
+            self.ingest(str(site), block[:, 0], block[:, 1:])
+
+
+# --- แหล่งข้อมูล: ไฟล์ที่มีการเขียนต่อท้ายเรื่อยๆ (แทน Gateway จริง) ---
+class FileTailSource:
+    def __init__(self, path, from_start=False, poll_interval=0.5):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._file = open(path, 'r', encoding='utf-8')
+        if not from_start:
+            self._file.seek(0, os.SEEK_END)
+        self._partial = ''
+
+    def read(self, max_lines=10000):
+        lines = []
+        while len(lines) < max_lines:
+            line = self._file.readline()
+            if not line:
+                break
+            if not line.endswith('\n'):
+                # บรรทัดยังเขียนไม่เสร็จ เก็บไว้รอรอบหน้า
+                self._partial += line
+                break
+            lines.append(self._partial + line)
+            self._partial = ''
+        if not lines:
+            time.sleep(self.poll_interval)
+        return lines
+
+    def close(self):
+        self._file.close()
+
+
+# --- แหล่งข้อมูล: UDP Socket (1 datagram มีได้หลายบรรทัด) ---
+class UdpSource:
+    def __init__(self, host='127.0.0.1', port=9870, timeout=0.5, bufsize=65536):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.timeout = timeout
+        self.bufsize = bufsize
+
+    @property
+    def address(self):
+        return self.sock.getsockname()
+
+    def read(self, max_lines=10000):
+        lines = []
+        # รอ datagram แรกตาม timeout จากนั้นดึงที่ค้างอยู่ทั้งหมดแบบไม่รอ
+        self.sock.settimeout(self.timeout)
+        try:
+            while len(lines) < max_lines:
+                data = self.sock.recv(self.bufsize)
+                lines.extend(data.decode('utf-8', errors='replace').splitlines())
+                self.sock.settimeout(0)
+        except (socket.timeout, BlockingIOError):
+            pass
+        return lines
+
+    def close(self):
+        self.sock.close()
+
+
+# --- เลือก Source จาก string เช่น "udp://0.0.0.0:9870" หรือ path ของไฟล์ ---
+def make_source(location):
+    if location.startswith('udp://'):
+        host, _, port = location[len('udp://'):].rpartition(':')
+        return UdpSource(host or '0.0.0.0', int(port))
+    return FileTailSource(location)
+
+
+class Ingestor:
+    def __init__(self, hub, source, batch_size=10000):
+        self.hub = hub
+        self.source = source
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="telemetry-ingest", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                lines = self.source.read(self.batch_size)
+                if lines:
+                    self.hub.ingest_lines(lines)
+            except Exception:
+                self.hub.errors += 1
+                time.sleep(1)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.source.close()
@@ -0,0 +1,143 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fetchers
+
+# ==========================================
+# ทดสอบ FetcherPool กับ HTTP Server จำลองในเครื่อง (แทน Gateway / Google Sheet จริง)
+#   python -m unittest test_fetchers
+# ==========================================
+
+
+class StandInServer:
+    # ตอบตามคิว status ที่กำหนด (หมดคิวแล้วใช้ default) และนับจำนวน request
+    def __init__(self):
+        self.queue = []
+        self.default = 200
+        self.body = b"ok"
+        self.requests = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                    status = server.queue.pop(0) if server.queue else server.default
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(server.body)))
+                self.end_headers()
+                self.wfile.write(server.body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/feed"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class FetcherPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.backoff = fetchers.BACKOFF_BASE
+        fetchers.BACKOFF_BASE = 0.01
+        self.server = StandInServer()
+        self.pool = None
+
+    def tearDown(self):
+        fetchers.BACKOFF_BASE = self.backoff
+        if self.pool is not None:
+            self.pool.stop()
+        self.server.close()
+
+    def make_pool(self, **kwargs):
+        self.pool = fetchers.FetcherPool(**kwargs)
+        return self.pool
+
+    def test_retry_recovers_from_5xx(self):
+        self.server.queue = [503, 502]
+        pool = self.make_pool()
+        result = pool.fetch(fetchers.Source('gw', self.server.url, retries=2))
+        self.assertIsNone(result.error)
+        self.assertEqual(result.status, 200)
+        self.assertEqual(result.value, b"ok")
+        self.assertEqual(self.server.requests, 3)
+
+    def test_exhausted_retries_keep_http_status(self):
+        self.server.default = 503
+        pool = self.make_pool()
+        result = pool.fetch(fetchers.Source('gw', self.server.url, retries=1))
+        self.assertEqual(result.status, 503)
+        self.assertEqual(result.error, "HTTP 503")
+        self.assertIsNotNone(result.elapsed)
+        self.assertEqual(self.server.requests, 2)
+
+    def test_4xx_is_not_retried(self):
+        self.server.default = 404
+        pool = self.make_pool()
+        result = pool.fetch(fetchers.Source('gw', self.server.url, retries=3))
+        self.assertEqual(result.status, 404)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_failure_keeps_last_good_value(self):
+        received = []
+        pool = self.make_pool()
+        pool.add(fetchers.Source('gw', self.server.url, interval=0.05, retries=0, on_result=received.append))
+        pool.start()
+        self.assertTrue(wait_until(lambda: pool.get('gw') is not None and pool.get('gw').value == b"ok"))
+        good = pool.get('gw').fetched_at
+
+        self.server.default = 500
+        self.assertTrue(wait_until(lambda: pool.get('gw').error is not None))
+        result = pool.get('gw')
+        self.assertEqual(result.value, b"ok")
+        self.assertEqual(result.fetched_at, good)
+        self.assertEqual(result.status, 500)
+        self.assertTrue(received)
+
+    def test_breaker_opens_then_half_opens_and_closes(self):
+        self.server.default = 500
+        pool = self.make_pool(breaker_threshold=3, breaker_cooldown=0.5)
+        pool.add(fetchers.Source('gw', self.server.url, interval=0.02, retries=0))
+        pool.start()
+        self.assertTrue(wait_until(lambda: pool.breakers['gw'].state == fetchers.OPEN))
+
+        # วงจรเปิด: ไม่มี request ไปที่ Server จนกว่าจะครบ cooldown
+        calls = self.server.requests
+        time.sleep(0.2)
+        self.assertEqual(self.server.requests, calls)
+
+        # ครบ cooldown = half-open ลองใหม่ 1 ครั้ง สำเร็จแล้ววงจรปิด
+        self.server.default = 200
+        self.assertTrue(wait_until(lambda: pool.breakers['gw'].state == fetchers.CLOSED))
+        self.assertIsNone(pool.get('gw').error)
+        self.assertEqual(pool.status()[0]['Circuit'], fetchers.CLOSED)
+
+    def test_half_open_failure_reopens(self):
+        breaker = fetchers.CircuitBreaker(threshold=2, cooldown=0.05)
+        breaker.failure()
+        breaker.failure()
+        self.assertEqual(breaker.state, fetchers.OPEN)
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, fetchers.HALF_OPEN)
+        breaker.failure()
+        self.assertEqual(breaker.state, fetchers.OPEN)
+
+
+if __name__ == '__main__':
+    unittest.main()
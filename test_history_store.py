@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+import history_store
+
+# ==========================================
+# ทดสอบ HistoryStore เมื่อเขียนไฟล์ไม่สำเร็จ (จำลอง Disk เต็ม): ข้อมูลต้องไม่หาย และ Thread เขียนไฟล์ต้องไม่หยุด
+#   python -m unittest test_history_store
+# ==========================================
+
+COLUMNS = ('CQ1', 'CQ2')
+DAY_START = 20000 * history_store.DAY
+
+
+class FailingWrites:
+    # แทน pq.write_table: ทิ้งไฟล์ tmp ไว้ครึ่งไฟล์แล้วโยน OSError ตามจำนวนครั้งที่กำหนด จากนั้นเขียนจริง
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+        self.write_table = history_store.pq.write_table
+
+    def __call__(self, table, where, **kwargs):
+        self.calls += 1
+        if self.failures > 0:
+            self.failures -= 1
+            with open(where, 'wb') as f:
+                f.write(b"PAR1")
+            raise OSError(28, "No space left on device")
+        return self.write_table(table, where, **kwargs)
+
+
+def rows(start, n):
+    times = start + np.arange(n, dtype=np.float64)
+    return times, np.column_stack([times, -times])
+
+
+def leftover_tmp_files(root):
+    return [f for _, _, files in os.walk(root) for f in files if f.startswith('.')]
+
+
+class HistoryStoreWriteErrorTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='history-test-')
+        self.write_table = history_store.pq.write_table
+        self.store = None
+
+    def tearDown(self):
+        history_store.pq.write_table = self.write_table
+        if self.store is not None:
+            self.store._stop.set()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def make_store(self, **kwargs):
+        self.store = history_store.HistoryStore(self.root, COLUMNS, **kwargs)
+        return self.store
+
+    def fail_writes(self, failures):
+        writes = history_store.pq.write_table = FailingWrites(failures)
+        return writes
+
+    def assert_all_rows(self, store, times):
+        result = store.query('S', times[0], times[-1] + 1)
+        np.testing.assert_array_equal(result['time'], times)
+        np.testing.assert_array_equal(result['CQ2'], -times)
+
+    def test_failed_flush_keeps_buffer_and_removes_tmp(self):
+        store = self.make_store()
+        times, values = rows(DAY_START + 100, 50)
+        store.append('S', times, values)
+
+        self.fail_writes(1)
+        with self.assertRaises(OSError):
+            store.flush()
+        self.assertEqual(store.buffers['S'].size, 50)
+        self.assertEqual(leftover_tmp_files(self.root), [])
+
+        store.flush()
+        self.assertNotIn('S', store.buffers)
+        self.assert_all_rows(store, times)
+
+    def test_failure_on_second_day_does_not_duplicate_first(self):
+        store = self.make_store()
+        times, values = rows(DAY_START + history_store.DAY - 10, 20)
+        store.append('S', times, values)
+
+        # วันแรกเขียนสำเร็จ วันที่สองล้มเหลว: Buffer เหลือเฉพาะแถวของวันที่สอง
+        calls = []
+
+        def second_fails(table, where, **kwargs):
+            calls.append(where)
+            if len(calls) == 2:
+                raise OSError(28, "No space left on device")
+            return self.write_table(table, where, **kwargs)
+
+        history_store.pq.write_table = second_fails
+        with self.assertRaises(OSError):
+            store.flush()
+        self.assertEqual(store.buffers['S'].size, 10)
+
+        store.flush()
+        self.assert_all_rows(store, times)
+
+    def test_full_buffer_on_ingest_path_does_not_raise(self):
+        store = self.make_store(flush_rows=10)
+        writes = self.fail_writes(3)
+        times, values = rows(DAY_START, 35)
+        for start in range(0, 35, 5):
+            store.append('S', times[start:start + 5], values[start:start + 5])
+        self.assertGreaterEqual(writes.calls, 3)
+        self.assertEqual(leftover_tmp_files(self.root), [])
+
+        store.flush()
+        self.assertNotIn('S', store.buffers)
+        self.assert_all_rows(store, times)
+
+    def test_flush_thread_survives_write_error(self):
+        store = self.make_store(flush_interval=0.05)
+        writes = self.fail_writes(2)
+        times, values = rows(DAY_START, 20)
+        store.append('S', times, values)
+        store.start()
+
+        deadline = time.monotonic() + 5
+        while 'S' in store.buffers and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertTrue(store._thread.is_alive())
+        self.assertEqual(writes.failures, 0)
+        self.assertNotIn('S', store.buffers)
+        self.assert_all_rows(store, times)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+import io
+import os
+import threading
+import time
+
+import pandas as pd
+import requests
+
+# ==========================================
+# User Directory: โหลดรายชื่อสมาชิกจาก Google Sheet ครั้งเดียวต่อ process
+# แล้วเก็บเป็น dict {username: [record, ...]} ให้ Login / Cookie ค้นหาแบบ O(1)
+# ==========================================
+
+USER_COLUMNS = ['username', 'password', 'name', 'role']
+RETRY_BASE = 5     # โหลดครั้งแรกไม่สำเร็จ: รอ 5, 10, 20, ... วินาทีก่อนลองใหม่ (ใน background)
+RETRY_MAX = 300
+
+
+# --- แปลง CSV เป็น DataFrame (ใช้กติกาเดียวกับ load_users() เดิม) ---
+def parse_users(raw):
+    df = pd.read_csv(io.BytesIO(raw), on_bad_lines='skip', dtype=str)
+    if len(df.columns) >= 5:
+        df.columns.values[1] = 'username'
+        df.columns.values[2] = 'password'
+        df.columns.values[3] = 'name'
+        df.columns.values[4] = 'role'
+
+    df['password'] = df['password'].astype(str)
+    df['role'] = df['role'].fillna('User')
+    return df
+
+
+# --- สร้าง index username -> records (เก็บทุกแถว เผื่อสมัครซ้ำ เหมือนการ filter DataFrame เดิม) ---
+def build_index(df):
+    index = {}
+    for username, password, name, role in df[USER_COLUMNS].itertuples(index=False):
+        record = {
+            'username': str(username),
+            'password': str(password),
+            'name': name,
+            'role': str(role).strip(),
+        }
+        index.setdefault(record['username'], []).append(record)
+    return index
+
+
+# --- แหล่งข้อมูล: URL (รองรับ ETag / Last-Modified) ---
+class HttpSource:
+    def __init__(self, url, timeout=10, session=None):
+        self.url = url
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.etag = None
+        self.last_modified = None
+
+    # คืนค่า bytes ถ้ามีข้อมูลใหม่, None ถ้าไม่เปลี่ยน (HTTP 304)
+    def fetch(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+
+        resp = self.session.get(self.url, headers=headers, timeout=self.timeout)
+        if resp.status_code == 304:
+            return None
+        resp.raise_for_status()
+        self.etag = resp.headers.get('ETag')
+        self.last_modified = resp.headers.get('Last-Modified')
+        return resp.content
+
+
+# --- แหล่งข้อมูล: ไฟล์ CSV ในเครื่อง (สำหรับทดสอบแบบ Offline) ---
+class FileSource:
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+
+    def fetch(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self.mtime:
+            return None
+        with open(self.path, 'rb') as f:
+            raw = f.read()
+        self.mtime = mtime
+        return raw
+
+
+def make_source(location):
+    if location.startswith(('http://', 'https://')):
+        return HttpSource(location)
+    return FileSource(location)
+
+
+class UserDirectory:
+    def __init__(self, source, ttl=300):
+        self.source = make_source(source) if isinstance(source, str) else source
+        self.ttl = ttl
+        self.frame = pd.DataFrame()
+        self.index = {}
+        self.loaded_at = None
+        self.last_error = None
+        self.failures = 0
+        self.retry_at = None  # เวลา (monotonic) ที่จะลองโหลดใหม่ หลังโหลดครั้งแรกไม่สำเร็จ
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._first_load = threading.Event()
+
+    # --- โหลดข้อมูลแบบ blocking (ใช้ตอนเริ่มต้น หรือเรียกตรงๆ ตอนทดสอบ) ---
+    def refresh(self):
+        try:
+            raw = self.source.fetch()
+            if raw is not None:
+                df = parse_users(raw)
+                index = build_index(df)
+                # สลับ reference ทีเดียว ผู้อ่านจะเห็นข้อมูลชุดเก่าหรือชุดใหม่ครบชุดเสมอ
+                self.frame, self.index = df, index
+            self.loaded_at = time.monotonic()
+            self.last_error = None
+            self.failures = 0
+            self.retry_at = None
+        except Exception as e:
+            # ถ้าโหลดไม่ได้ ให้ใช้ข้อมูลชุดเดิมต่อไป แล้วลองใหม่รอบหน้า
+            self.last_error = e
+            if self.loaded_at is not None:
+                self.loaded_at = time.monotonic()
+            else:
+                # ยังไม่มีข้อมูลเลย: เว้นช่วงแบบ backoff ระหว่างนี้ผู้เรียกได้รายชื่อว่างทันที ไม่ต้องรอ network
+                self.failures += 1
+                self.retry_at = time.monotonic() + min(RETRY_MAX, RETRY_BASE * 2 ** (self.failures - 1))
+        finally:
+            with self._lock:
+                self._refreshing = False
+            self._first_load.set()
+
+    # --- Stale-while-revalidate: คืนข้อมูลเดิมทันที แล้วค่อยโหลดใหม่ใน background ---
+    def _ensure_fresh(self):
+        if self.loaded_at is None and self.retry_at is not None:
+            # โหลดครั้งแรกล้มเหลวไปแล้ว: ครบเวลาค่อยลองใหม่ใน background ไม่ block ผู้เรียก
+            if time.monotonic() < self.retry_at:
+                return
+            self._refresh_in_background()
+            return
+
+        if self.loaded_at is None:
+            # ยังไม่เคยโหลด: ผู้เรียกคนแรกโหลดเอง คนอื่นรอจนโหลดเสร็จ (ไม่คืนรายชื่อว่าง)
+            with self._lock:
+                loading = self._refreshing
+                if not loading:
+                    self._refreshing = True
+                    self._first_load.clear()
+            if loading:
+                self._first_load.wait()
+            else:
+                self.refresh()
+            return
+
+        if time.monotonic() - self.loaded_at < self.ttl:
+            return
+        self._refresh_in_background()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name="user-directory-refresh", daemon=True).start()
+
+    def get(self, username):
+        self._ensure_fresh()
+        records = self.index.get(str(username))
+        return records[0] if records else None
+
+    def authenticate(self, username, password):
+        self._ensure_fresh()
+        for record in self.index.get(str(username), ()):
+            if record['password'] == str(password):
+                return record
+        return None
+
+    def users(self):
+        self._ensure_fresh()
+        return self.frame